@@ -1,19 +1,46 @@
 #!/usr/bin/python3
 
+import time
+# taken first, so the startup report includes importing everything else
+IMPORT_START = time.perf_counter_ns()
+
 import sys
 import random
 import math
 import os
 import getopt
+import itertools
 import pygame
 import shelve
-import time
 from pygame.locals import *
+from spatialhash import SpatialHash
+from physics import friction_decay, FixedTimestep
+from glyphcache import GlyphCache
+from textcache import FontRegistry, TextCache
+from dirtyrects import DirtyRects
+from replay import ReplayRecorder, ReplayPlayer, digest
+import snapshot
+from rewind import RewindBuffer
+from compositor import Compositor
+from profiler import PhaseProfiler, NULL_PROFILER, StartupTimer, CpuMeter
+from gameclock import GameClock, MODES
+from atlas import Atlas
+from highscores import HighscoreStore
+from bindings import KeyBindings, allow_events, GAME_EVENTS, MENU_EVENTS, \
+    EXPOSE_EVENTS
+from enemypool import EnemyPool
+from controllers import BOTS
+try:
+    from enemystore import EnemyStore
+except ImportError:
+    EnemyStore = None
 
 if not pygame.font:
     print('Warning, fonts disabled')
 if not pygame.mixer:
     print('Warning, sound disabled')
+if not EnemyStore:
+    print('Warning, numpy not found, using slower enemy updates')
 
 # setting up constants
 WINDOW_WIDTH = 640
@@ -28,31 +55,63 @@ GREY = (100, 100, 100)
 BACKGROUND_COLOR = DARK_GREEN
 COLLISION_RECT_COLOR = [n * 0.8 for n in BACKGROUND_COLOR]
 MAX_FPS = 60
+# menus left alone this long (in milliseconds) animate at MENU_IDLE_FPS
+# instead, and sleep in between
+MENU_IDLE_AFTER = 10 * 1000
+MENU_IDLE_FPS = 10
 ENEMY_SPAWNDELAY = 500  # divided by current level
 windowcolor = BLACK
 PLAYER_SPEED = .025
+# the player is hit where the middle of its silhouette, this many pixels
+# narrower and shorter than the sprite, overlaps an enemy's pixels
+PLAYER_HITBOX_SHRINK = 14
 FRICTION = 0.00667
 ENEMY_MIN_SPEED = 0.01
 ENEMY_MAX_SPEED = 0.2
 LEVEL_LENGTH = 6 * 1000  # in milliseconds
-
-# get fonts from /data/fonts*
-FONTFILES = [f for f in os.listdir(os.path.join("data", "fonts"))
-             if f.endswith('.ttf')]
-FONTS = []  # None = default font
-for file in FONTFILES:
-    FONTS.append(os.path.join("data", "fonts", file))
-MENU_FONT = os.path.join("data", "fonts", "kenpixel.ttf")  # used for main menu
+# (first level, one in how many) of the numbers spawned on the right that
+# move erratically, are aimed at a player, or start rotated, and of the
+# numbers spawned on the left that move erratically
+ERRATIC_ODDS = (4, 10)
+AIMED_ODDS = (2, 10)
+ROTATED_ODDS = (2, 4)
+LEFT_ERRATIC_ODDS = (3, 2)
+# length of one simulation step in milliseconds, independent of frame rate
+PHYSICS_STEP = 1000.0 / 60
+# phases of a frame timed by the profiler (F5), in order
+PROFILE_PHASES = ['wait', 'input', 'collision', 'spawning', 'updates',
+                  'rewind', 'hud', 'render', 'display']
+# frames Shift+F7 rewinds at once
+REWIND_JUMP = 60
+# the darkening over the scene behind menus and the game over screen
+DIM_FILL = (0, 0, 0, 200)
+
+# data lives next to the script, or next to the executable when frozen by
+# cx_Freeze, wherever the game is started from
+if getattr(sys, 'frozen', False):
+    DATA_DIR = os.path.join(os.path.dirname(sys.executable), 'data')
+else:
+    DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'data')
+
+
+def data_path(*names):
+    return os.path.join(DATA_DIR, *names)
+
+
+MENU_FONT = data_path("fonts", "kenpixel.ttf")  # used for main menu
 GAME_OVER_FONT = None  # None = pygame default, used for game over screen
 # None = pygame default, used for fps/frametime/enemy number indicators in game
 GUI_FONT = None
 
-NUMBER_IMAGES = []
-for i in range(10):
-    image = pygame.image.load(
-        os.path.join("data", "numbers", "%d.png" % i))
-    image.set_colorkey(BLACK)
-    NUMBER_IMAGES.append(image)
+# nothing is loaded at import time; these are filled in on first use (or
+# by warm_up())
+_fonts = None
+_number_images = None
+_atlas = None
+_player_mask = None
+
+startup = StartupTimer(IMPORT_START)
 
 
 class Player():
@@ -60,11 +119,11 @@ class Player():
     """The player. Can move left/right and up/down."""
 
     def __init__(self, controls='all'):
-        self.image, self.rect = load_image('player.png')
+        self.image = get_atlas().view('player.png')
+        self.rect = self.image.get_rect()
         self.pos = WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2
 
-        screen = pygame.display.get_surface()
-        self.area = screen.get_rect()
+        self.area = Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
         self.speed = PLAYER_SPEED
 
         self.state = "still"
@@ -73,6 +132,9 @@ class Player():
         self.moveup = 0
         self.movedown = 0
         self.controls = controls
+        # if set, moves the player instead of the keyboard (see
+        # controllers.py)
+        self.controller = None
 
         self.reinit()
 
@@ -80,12 +142,30 @@ class Player():
         self.state = "still"
         self.movepos = [0, 0]
 
+    def hitbox(self):
+        # the rect an enemy's rect must overlap to hit the player; the mask
+        # says which of its pixels count
+        return self.rect.inflate(-PLAYER_HITBOX_SHRINK, -PLAYER_HITBOX_SHRINK)
+
+    def get_mask(self):
+        return get_player_mask()
+
+    def rect_ahead(self, alpha):
+        # where to draw the player alpha of a step after the last one,
+        # keeping to the screen
+        if not self.movepos[0] and not self.movepos[1]:
+            return self.rect
+        return Rect((self.pos[0] + self.movepos[0] * alpha,
+                     self.pos[1] + self.movepos[1] * alpha),
+                    self.rect.size).clamp(self.area)
+
     def update(self, time_passed):
 
         # friction
-        for i in range(time_passed):
-            self.movepos[0] = self.movepos[0] * (1.0 - FRICTION)
-            self.movepos[1] = self.movepos[1] * (1.0 - FRICTION)
+        self.movepos[0] = friction_decay(
+            self.movepos[0], FRICTION, time_passed)
+        self.movepos[1] = friction_decay(
+            self.movepos[1], FRICTION, time_passed)
         if abs(self.movepos[0]) < 0.1:
             self.movepos[0] = 0
         if abs(self.movepos[1]) < 0.1:
@@ -118,6 +198,12 @@ class Player():
             self.pos = newpos
 
 
+# every enemy set up gets the next number, so that it can be told apart
+# from the others (and from whatever its object was before being reused),
+# e.g. over the network
+enemy_serials = itertools.count(1)
+
+
 class Enemy(pygame.sprite.Sprite):
 
     """An enemy: comes from the right,
@@ -128,26 +214,68 @@ class Enemy(pygame.sprite.Sprite):
     rotated: if True, the image is rotated 90, 180, or 270 degrees.
     """
 
-    def __init__(self, x, y, speed, game, image, erratic=False, aimed=False,
-                 rotated=False):
+    # the image get_mask() last made a mask of
+    mask_image = None
+
+    def __init__(self, *args, **kwargs):
+        # takes the same arguments as reset(); with none, the enemy is left
+        # for restore() to set up
         pygame.sprite.Sprite.__init__(self)
+        self.rect = Rect(0, 0, 0, 0)
+        if args or kwargs:
+            self.reset(*args, **kwargs)
+
+    def reset(self, x, y, speed, game, image, erratic=False, aimed=False,
+              rotated=False):
+        # sets the enemy up as new; EnemyPool and EnemyStore use this to
+        # reuse dead ones
         self.image = image
-        self.rect = self.image.get_rect()
+        self.angle = 0
         if rotated:
             # rotate the image of the enemy in a random increment of 90
-            self.image = pygame.transform.rotate(
-                self.image, random.choice([90, 180, 270]))
-            # and get a new rect for it, too
-            self.rect = self.image.get_rect()
+            self.angle = game.random.choice([90, 180, 270])
+            self.image = self.rotate(self.image, self.angle)
+        self.serial = next(enemy_serials)
+        # the rect is reused, too
+        self.rect.topleft = 0, 0
+        self.rect.size = self.image.get_size()
         self.pos = x, y
-        screen = pygame.display.get_surface()
-        self.area = screen.get_rect()
         self.speed = speed
         self.game = game
         self.erratic = erratic
         self.aimed = aimed
+        self.rotated = rotated
         self.reinit()
 
+    def restore(self, game, image, pos, movepos, speed, erratic, aimed,
+                rotated, angle, serial):
+        # sets the enemy up as it was when a snapshot was taken, without
+        # drawing any random numbers; image is already rotated
+        self.image = image
+        self.angle = angle
+        self.serial = serial
+        self.rect.size = image.get_size()
+        self.rect.topleft = pos
+        self.pos = pos
+        self.movepos = movepos
+        self.speed = speed
+        self.game = game
+        self.erratic = erratic
+        self.aimed = aimed
+        self.rotated = rotated
+        self.state = "still"
+
+    def rotate(self, image, angle):
+        return pygame.transform.rotate(image, angle)
+
+    def get_mask(self):
+        # the image's opaque pixels, for exact collisions; made the first
+        # time they are needed, and again if the image changes
+        if self.mask_image is not self.image:
+            self.mask = pygame.mask.from_surface(self.image)
+            self.mask_image = self.image
+        return self.mask
+
     def reinit(self):
         self.state = "still"
         if not self.aimed:
@@ -156,7 +284,7 @@ class Enemy(pygame.sprite.Sprite):
         else:
             # pick random player to move towards
             player = self.game.players[
-                random.randint(0, len(self.game.players) - 1)]
+                self.game.random.randint(0, len(self.game.players) - 1)]
             # calculate vector to player
             self.movepos = [
                 player.pos[0] - self.pos[0], player.pos[1] - self.pos[1]]
@@ -170,95 +298,127 @@ class Enemy(pygame.sprite.Sprite):
                 self.movepos[0], self.speed * self.movepos[1]
 
     def update(self, time_passed):
+        # returns False once the enemy has left the screen on the left
 
         if self.erratic:  # moves erratically up and down
-            self.movepos[
-                1] += random.uniform(-ENEMY_MIN_SPEED, ENEMY_MIN_SPEED)
+            self.movepos[1] += self.game.random.uniform(
+                -ENEMY_MIN_SPEED, ENEMY_MIN_SPEED)
 
         newpos = self.pos[0] + self.movepos[0] * \
             time_passed, self.pos[1] + self.movepos[1] * time_passed
         if newpos[0] + self.rect.w > -5:
             self.pos = newpos
             self.rect.x, self.rect.y = newpos
-        else:
-            self.game.enemies.remove(self)
+            return True
+        return False
+
+    def kind(self):
+        # what sort of enemy this is, for statistics
+        kinds = [name for name in ('erratic', 'aimed', 'rotated')
+                 if getattr(self, name)]
+        return '+'.join(kinds) or 'straight'
+
+
+class LevelBanner(Enemy):
+
+    """The 'LEVEL n' text that crosses the screen at each new level."""
+
+    # not a number; a scale of 0 marks banners in snapshots
+    scale = 0
+
+    def reset(self, x, y, speed, game, text):
+        self.text = text
+        # uses pygame default font, due to munro having bad hitbox at large
+        # sizes
+        image = self.render(text)
+        super(LevelBanner, self).reset(x, y, speed, game, image)
+
+    def restore(self, game, text, scale, *args):
+        # scale is always 0, banners aren't numbers
+        self.text = text
+        super(LevelBanner, self).restore(game, self.render(text), *args)
+
+    def render(self, text):
+        return text_cache.render(fonts.get(None, 50), text, RED)
+
+    def kind(self):
+        return 'level banner'
 
 
 class TextEnemy(Enemy):
 
-    def __init__(self, x, y, speed, game, text, **kwargs):
-        image = render_number(text)
-        super(TextEnemy, self).__init__(x, y, speed, game, image, **kwargs)
+    def reset(self, x, y, speed, game, text, **kwargs):
+        self.text = text
+        self.scale = game.random.randint(3, 4)
+        image = render_number(text, self.scale)
+        super(TextEnemy, self).reset(x, y, speed, game, image, **kwargs)
+
+    def restore(self, game, text, scale, pos, movepos, speed, erratic, aimed,
+                rotated, angle, serial):
+        self.text = text
+        self.scale = scale
+        image = render_number(text, scale, angle)
+        super(TextEnemy, self).restore(game, image, pos, movepos, speed,
+                                       erratic, aimed, rotated, angle, serial)
 
+    def rotate(self, image, angle):
+        # rotated glyphs are cached too
+        return render_number(self.text, self.scale, angle)
 
-class Dimmer:
+    def get_mask(self):
+        # and so are their masks
+        return glyph_cache.mask(self.text, self.scale, self.angle)
 
-    """Class for dimming the screen."""
 
-    def __init__(self, keepalive=0):
-        self.keepalive = keepalive
-        if self.keepalive:
-            self.buffer = pygame.Surface(
-                pygame.display.get_surface().get_size())
-        else:
-            self.buffer = None
-
-    def dim(self, darken_factor=64, color_filter=(0, 0, 0)):
-        if not self.keepalive:
-            self.buffer = pygame.Surface(
-                pygame.display.get_surface().get_size())
-        self.buffer.blit(pygame.display.get_surface(), (0, 0))
-        if darken_factor > 0:
-            darken = pygame.Surface(pygame.display.get_surface().get_size())
-            darken.fill(color_filter)
-            darken.set_alpha(darken_factor)
-            # safe old clipping rectangle...
-            old_clip = pygame.display.get_surface().get_clip()
-            # ..blit over entire screen...
-            pygame.display.get_surface().blit(darken, (0, 0))
-            # pygame.display.flip()
-            # ... and restore clipping
-            pygame.display.get_surface().set_clip(old_clip)
-
-    def undim(self):
-        if self.buffer:
-            pygame.display.get_surface().blit(self.buffer, (0, 0))
-            if not self.keepalive:
-                self.buffer = None
-
-
-def render_number(text_number):
+def render_number(text_number, scale, rotation=0):
+    # glyphs are shared between enemies, so never draw on the result
+    return glyph_cache.get(text_number, scale, rotation)
+
+
+def draw_number(text_number, scale, rotation=0):
+    # renders a number from the digits in the atlas; use render_number
+    # instead
+    if rotation:
+        return pygame.transform.rotate(
+            render_number(text_number, scale), rotation)
+
     font_width = 5
     font_height = 7
 
-    int_digits = [int(digit) for digit in text_number]
+    atlas = get_atlas()
+    digit_rects = [atlas.rect(digit) for digit in text_number]
 
-    image_width = sum(NUMBER_IMAGES[d].get_width() for d in int_digits) + \
+    image_width = sum(rect.w for rect in digit_rects) + \
         2 * (len(text_number) - 1)
 
     image = pygame.Surface((image_width, font_height))
 
+    # copy every digit out of the atlas in one call
     x = 0
-
-    for digit in text_number:
-        int_digit = int(digit)
-        digit_image = NUMBER_IMAGES[int_digit]
-        image.blit(digit_image, ((x, 0), digit_image.get_size()))
-        x += NUMBER_IMAGES[int_digit].get_width() + 2
-        image.set_colorkey(BLACK)
-    scale = random.randint(3, 4)
+    blits = []
+    for rect in digit_rects:
+        blits.append((atlas.surface, (x, 0), rect))
+        x += rect.w + 2
+    image.blits(blits, doreturn=False)
+    image.set_colorkey(BLACK)
     return pygame.transform.scale(
         image, (image.get_width() * scale, image.get_height() * scale))
 
 
+glyph_cache = GlyphCache(draw_number)
+
+
 def load_image(name, colorkey=None):
-    fullname = os.path.join('data', name)
+    fullname = data_path(name)
     try:
         image = pygame.image.load(fullname)
     except pygame.error as message:
         print(('Cannot load image:', name))
         raise SystemExit(message)
-    image = image.convert_alpha()
+    # without a display (e.g. a headless Simulation) images can't be
+    # converted, but are still good for their rects
+    if pygame.display.get_surface():
+        image = image.convert_alpha()
     if colorkey is not None:
         if colorkey is -1:
             colorkey = image.get_at((0, 0))
@@ -266,9 +426,86 @@ def load_image(name, colorkey=None):
     return image, image.get_rect()
 
 
+def get_number_images():
+    # the images of the digits 0-9, from data/numbers
+    global _number_images
+    if _number_images is None:
+        _number_images = []
+        for i in range(10):
+            # not converted, as the atlas copies colorkeyed and per-pixel
+            # alpha images differently
+            image = pygame.image.load(data_path("numbers", "%d.png" % i))
+            image.set_colorkey(BLACK)
+            _number_images.append(image)
+    return _number_images
+
+
+def get_atlas():
+    # the digits and sprites, packed into one Atlas the first time they are
+    # needed (after the display is set, so it is in the display's format)
+    global _atlas
+    if _atlas is None:
+        images = dict((str(i), image)
+                      for i, image in enumerate(get_number_images()))
+        for name in ('player.png', 'icon.gif'):
+            images[name] = load_image(name)[0]
+        _atlas = Atlas(images)
+    return _atlas
+
+
+def get_player_mask():
+    # the player sprite's silhouette, cropped to its hitbox (see
+    # Player.hitbox), made the first time it is needed
+    global _player_mask
+    if _player_mask is None:
+        image = get_atlas().view('player.png')
+        outline = pygame.mask.from_surface(image)
+        w, h = outline.get_size()
+        # the sprite is only an outline, with gaps; thickened by a pixel to
+        # close them (with a pixel of margin all round), everything the
+        # outside can't reach is the inside. The outside then grows back
+        # by the pixel, so the silhouette ends at the sprite's own edge
+        padded = pygame.mask.Mask((w + 4, h + 4))
+        for dx in range(1, 4):
+            for dy in range(1, 4):
+                padded.draw(outline, (dx, dy))
+        padded.invert()
+        outside = padded.connected_component((0, 0))
+        silhouette = pygame.mask.Mask((w + 4, h + 4))
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                silhouette.draw(outside, (dx, dy))
+        silhouette.invert()
+        silhouette.draw(outline, (2, 2))
+        hitbox = Rect(0, 0, w, h).inflate(
+            -PLAYER_HITBOX_SHRINK, -PLAYER_HITBOX_SHRINK)
+        _player_mask = pygame.mask.Mask(hitbox.size)
+        _player_mask.draw(silhouette, (-2 - hitbox.x, -2 - hitbox.y))
+    return _player_mask
+
+
+def get_fonts():
+    # the .ttf fonts in data/fonts
+    global _fonts
+    if _fonts is None:
+        _fonts = [data_path("fonts", file)
+                  for file in sorted(os.listdir(data_path("fonts")))
+                  if file.endswith('.ttf')]
+    return _fonts
+
+
 def get_random_font():
-    # returns a random font from the list FONTS
-    return FONTS[random.randint(0, len(FONTS) - 1)]
+    # returns a random font from data/fonts
+    fonts = get_fonts()
+    return fonts[random.randint(0, len(fonts) - 1)]
+
+
+def warm_up():
+    # loads what the menu needs up front, so its first frame isn't slowed
+    # by loading
+    get_atlas()
+    fonts.get(MENU_FONT, 100)
+    fonts.get(MENU_FONT, 50)
 
 
 def get_frames_from_image(base_image, framenumber, framesize):
@@ -296,7 +533,7 @@ def load_sound(name):
             pass
     if not pygame.mixer:
         return NoneSound()
-    fullname = os.path.join('data', name)
+    fullname = data_path(name)
     try:
         sound = pygame.mixer.Sound(fullname)
     except pygame.error as message:
@@ -311,30 +548,41 @@ def terminate():
     sys.exit()
 
 
-def save_highscores(highscores):
-    file = shelve.open('data/highscores', 'n')
-    file['highscores'] = highscores
-    file.close()
-
-
 def load_highscores():
-    file = shelve.open('data/highscores', 'r')
+    # the highscore list of versions that kept it in a shelve file
+    file = shelve.open(data_path('highscores'), 'r')
     highscores = file['highscores']
     file.close()
     return highscores
 
 
-def playertouchingenemy(playerrect, enemies):
-    for enemy in enemies:
-        if playerrect.colliderect(enemy.rect):
-            return True
-    return False
+def open_highscores():
+    try:
+        store = HighscoreStore(data_path('highscores.sqlite'))
+    except Exception as message:
+        print('Cannot open highscores:', message)
+        return HighscoreStore(':memory:')
+    if not len(store):
+        # first run since highscores moved to SQLite; bring the old ones
+        try:
+            old = load_highscores()
+        except Exception:
+            old = []
+        for score in old:
+            if score:
+                store.add(score)
+        store.end_session()
+    return store
 
 
-def draw_text(text, font, surface, x, y, color=WHITE, background=None,
-              position="topleft"):
-    # draws some text using font to the surface
-    textobj = font.render(text, 1, color)
+fonts = FontRegistry()
+text_cache = TextCache()
+
+
+def place_text(text, font, x, y, color=WHITE, position="topleft"):
+    # renders some text using font (from fonts); returns it and the rect
+    # it goes in, with its position at (x, y)
+    textobj = text_cache.render(font, text, color)
     textrect = textobj.get_rect()
     if position == 'center':
         textrect.center = (x, y)
@@ -344,8 +592,15 @@ def draw_text(text, font, surface, x, y, color=WHITE, background=None,
         textrect.topleft = (x, y)
     elif position == 'topright':
         textrect.topright = (x, y)
+    return textobj, textrect
+
+
+def draw_text(text, font, surface, x, y, color=WHITE, background=None,
+              position="topleft"):
+    # draws some text using font (from fonts) to the surface
+    textobj, textrect = place_text(text, font, x, y, color, position)
     if background:
-        pygame.draw.rect(screen, background, textrect.inflate(2, 2))
+        pygame.draw.rect(surface, background, textrect.inflate(2, 2))
     surface.blit(textobj, textrect)
     return textrect.inflate(2, 2)  # for knowing where to redraw the background
 
@@ -358,7 +613,7 @@ class TextSprite(pygame.sprite.Sprite):
         self.text = text
         self.font = font
         self.color = color
-        self.image = font.render(text, 1, color)
+        self.image = text_cache.render(font, text, color)
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
 
@@ -366,10 +621,307 @@ class TextSprite(pygame.sprite.Sprite):
         return screen.blit(self.image, self.rect)
 
     def change_color(self, color):
-        self.image = self.font.render(self.text, 1, color)
+        self.image = text_cache.render(self.font, self.text, color)
         self.color = color
 
 
+class Simulation(object):
+
+    """The rules of the game: players, enemies, levels and score, without
+    any drawing or real-time waiting, so it runs headless (even without a
+    display) as fast as the CPU allows.
+
+    controls: one Player is created for each control type in controls.
+        'bot:NAME' makes a player driven by the bot NAME in
+        controllers.BOTS.
+    clock: function returning the milliseconds that passed since it was
+        last called; frame() asks it how much time to simulate.
+    input_source: object whose poll(simulation) method sets the players'
+        move flags; frame() calls it once per frame. May be None.
+    numpy_enemies: if True (and numpy is installed), enemies are updated in
+        batches.
+    seed: seed for the game's random numbers. Everything random in a game
+        comes from self.random, so the same seed, frame times and input
+        play out the same game.
+    """
+
+    def __init__(self, controls=('all',), clock=None, input_source=None,
+                 numpy_enemies=True, seed=None):
+        self.clock = clock
+        self.input_source = input_source
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.controls = controls
+        self.players = [self.new_player(i, c)
+                        for i, c in enumerate(controls)]
+        # players that died, kept so restore() can bring them back
+        self.dead_players = []
+        self.enemies = self.new_enemy_container(numpy_enemies)
+        # for finding the enemies near a player (see enemies_near), rebuilt
+        # when asked for after the enemies have moved
+        self.enemy_grid = SpatialHash(WINDOW_WIDTH, WINDOW_HEIGHT)
+        self.grid_step = None  # the step the grid was last built at
+        self.physics = FixedTimestep(PHYSICS_STEP)
+        self.level = 1
+        self.score = 0
+        self.spawntime = 0
+        self.time_until_new_level = LEVEL_LENGTH
+        self.game_over = False
+        # if True, collisions are still checked but never kill, for
+        # benchmarks and soak tests
+        self.invincible = False
+        self.profiler = NULL_PROFILER
+        # (time, level, controls, kind of enemy) of each player's death
+        self.deaths = []
+        # counters
+        self.frames = 0
+        self.steps = 0
+        self.time = 0  # simulated milliseconds
+        # exact (mask) collision tests in the last frame, and in all
+        self.mask_tests = 0
+        self.total_mask_tests = 0
+        # collision counters: enemy rects tested against a hitbox, those
+        # that overlapped it (the candidates for a mask test), and the
+        # times an enemy's pixels touched a player's (once a step at most
+        # for each player; more than deaths while invincible)
+        self.rect_tests = 0
+        self.candidates = 0
+        self.hits = 0
+
+    def new_player(self, i, controls):
+        # i is the player's place in self.controls
+        player = Player(controls)
+        if controls.startswith('bot:'):
+            # seeded from the game's seed rather than self.random, so the
+            # game plays out the same with or without bots
+            player.controller = BOTS[controls[4:]](
+                None if self.seed is None else self.seed + i)
+        return player
+
+    def new_enemy_container(self, numpy_enemies):
+        if numpy_enemies and EnemyStore:
+            return EnemyStore(ENEMY_MIN_SPEED,
+                              seed=self.random.getrandbits(64))
+        return EnemyPool()
+
+    def chance(self, odds):
+        # odds is (first level, one in how many)
+        first_level, one_in = odds
+        if self.level < first_level:
+            return False
+        return 1 == self.random.randint(1, one_in)
+
+    def spawn_number_enemies(self):
+        x = WINDOW_WIDTH - 10
+        y = self.random.randint(0, WINDOW_HEIGHT)
+        speed = self.random.uniform(ENEMY_MIN_SPEED, ENEMY_MAX_SPEED)
+        text = self.random.choice([str(self.random.randint(1, 1024))])
+        # by default 1/10 chance of erratic movement from level 4 onward,
+        # 1/10 chance of aimed movement and 1/4 chance of starting rotated
+        # from level 2 onward
+        erratic_movement = self.chance(ERRATIC_ODDS)
+        aimed = self.chance(AIMED_ODDS)
+        start_rotated = self.chance(ROTATED_ODDS)
+
+        self.enemies.spawn(
+            TextEnemy, x, y, speed, self,
+            text, erratic=erratic_movement, aimed=aimed,
+            rotated=start_rotated)
+
+        # spawn enemies on left to encourage player to run
+        # and to look cool
+        x = 10
+        y = self.random.randint(0, WINDOW_HEIGHT)
+        # fast as the average speed of an enemy
+        speed = (ENEMY_MAX_SPEED + ENEMY_MIN_SPEED) / 2
+        # after level 3, half of the left enemies move erratically
+        # this makes them look cooler and more terrifying
+        erratic_movement = self.chance(LEFT_ERRATIC_ODDS)
+
+        self.enemies.spawn(
+            TextEnemy, x, y, speed, self, text, erratic=erratic_movement)
+
+    def step(self, time_passed):
+        """Simulates one fixed step of time_passed milliseconds."""
+        # check if player has hit an enemy: first their rects, then, only
+        # if those overlap, their pixels. With a player or four, testing
+        # every enemy's rect in C beats sorting the enemies into a grid
+        for player in self.players[:]:
+            hitbox = player.hitbox()
+            enemy = None
+            candidates = self.enemies.colliding(hitbox)
+            self.rect_tests += len(self.enemies)
+            self.candidates += len(candidates)
+            for candidate in candidates:
+                if self.touching(hitbox, player, candidate):
+                    enemy = candidate
+                    self.hits += 1
+                    break
+            if enemy is not None and not self.invincible:
+                self.players.remove(player)
+                self.dead_players.append(player)
+                self.deaths.append(
+                    (self.time, self.level, player.controls, enemy.kind()))
+        self.profiler.lap('collision')
+        # check if all players are dead or not
+        # check seperate from death check to stop starting with no
+        # players
+        if len(self.players) == 0:
+            self.game_over = True
+            return
+        # new level if time
+        self.time_until_new_level -= time_passed
+        if self.time_until_new_level <= 0:
+            self.level += 1
+            self.time_until_new_level = LEVEL_LENGTH
+            # spawn 'new level' enemy
+            x = WINDOW_WIDTH - 10
+            y = self.random.randint(50, WINDOW_HEIGHT - 50)
+            speed = ENEMY_MAX_SPEED
+            text = "LEVEL " + str(self.level)
+            self.enemies.spawn(LevelBanner, x, y, speed, self, text)
+        # spawn enemies
+        self.spawntime += time_passed
+        # spawn enemies on right if SPAWN_DELAY time has passed
+        if self.spawntime >= ENEMY_SPAWNDELAY / math.sqrt(self.level):
+            self.spawntime -= ENEMY_SPAWNDELAY / math.sqrt(self.level)
+            self.score += 1
+            self.spawn_number_enemies()
+        self.profiler.lap('spawning')
+
+        for player in self.players:
+            player.update(time_passed)
+        self.enemies.update(time_passed)
+        self.profiler.lap('updates')
+
+    def enemies_near(self, rect):
+        """Returns the enemies in the grid cells rect overlaps, a superset
+        of those colliding with it; for wide searches, e.g. by bots."""
+        if self.grid_step != self.steps:
+            self.enemy_grid.rebuild(self.enemies)
+            self.grid_step = self.steps
+        return self.enemy_grid.query(rect)
+
+    def touching(self, hitbox, player, enemy):
+        # whether any of the player's pixels within hitbox overlap the
+        # enemy's
+        self.mask_tests += 1
+        self.total_mask_tests += 1
+        return player.get_mask().overlap(enemy.get_mask(), (
+            enemy.rect.x - hitbox.x, enemy.rect.y - hitbox.y)) is not None
+
+    def advance(self, time_passed):
+        """Simulates time_passed milliseconds of game time in fixed steps.
+        Returns the number of steps taken."""
+        steps = self.physics.advance(time_passed)
+        for i in range(steps):
+            self.step(PHYSICS_STEP)
+            self.steps += 1
+            self.time += PHYSICS_STEP
+            if self.game_over:
+                return i + 1
+        return steps
+
+    def frame(self):
+        """Runs one frame: reads the clock and the input source and
+        simulates the time that passed. Returns the frame's time."""
+        time_passed = self.clock()
+        self.profiler.lap('wait')
+        if self.input_source is not None:
+            self.input_source.poll(self)
+        for player in self.players:
+            if player.controller is not None:
+                player.controller.control(player, self)
+        self.profiler.lap('input')
+        self.mask_tests = 0
+        self.advance(time_passed)
+        self.frames += 1
+        return time_passed
+
+    def run(self, frames):
+        """Runs up to frames frames, stopping early on game over."""
+        for i in range(frames):
+            if self.game_over:
+                break
+            self.frame()
+
+    def snapshot(self):
+        """Returns the state of the game as bytes (see snapshot.py)."""
+        return snapshot.write(self)
+
+    def restore(self, data):
+        """Puts the game back in the state snapshot() returned as data.
+
+        Players are matched to the snapshot's by their controls, living or
+        dead, so they keep their controllers; bots' own state isn't in the
+        snapshot, though. The snapshot must have been taken with the same
+        kind of enemy container (NumPy or not)."""
+        global enemy_serials
+        state = snapshot.read(data)
+        rng = getattr(self.enemies, 'rng', None)
+        if (state.numpy_state is None) != (rng is None):
+            raise ValueError('snapshot was taken with%s NumPy enemies'
+                             % ('out' if rng else ''))
+        self.grid_step = None
+
+        self.frames = state.frames
+        self.steps = state.steps
+        self.time = state.time
+        self.level = state.level
+        self.score = state.score
+        self.spawntime = state.spawntime
+        self.time_until_new_level = state.time_until_new_level
+        self.physics.accumulator = state.accumulator
+        self.game_over = state.game_over
+        self.deaths = state.deaths
+
+        unused = self.players + self.dead_players
+        self.players = []
+        for controls, pos, movepos, keys in state.players:
+            for player in unused:
+                if player.controls == controls:
+                    unused.remove(player)
+                    break
+            else:
+                i = (self.controls.index(controls)
+                     if controls in self.controls else len(self.controls))
+                player = self.new_player(i, controls)
+            player.pos = pos
+            player.movepos = movepos
+            player.rect = Rect(pos, player.rect.size)
+            for name, value in keys.items():
+                setattr(player, name, value)
+            self.players.append(player)
+        self.dead_players = unused
+
+        self.enemies.clear()
+        for enemy in state.enemies():
+            text, scale = enemy[:2]
+            self.enemies.restore(TextEnemy if scale else LevelBanner,
+                                 self, *enemy)
+        if state.serials:
+            # new enemies mustn't reuse the restored ones' serials
+            enemy_serials = itertools.count(
+                max(max(state.serials) + 1, next(enemy_serials)))
+
+        # last, as setting the enemies up may draw random numbers
+        self.random.setstate(state.random_state)
+        if rng is not None:
+            rng.bit_generator.state = state.numpy_state
+
+
+class FixedClock(object):
+
+    """A clock for Simulation that says the same time passed every frame,
+    for running games faster than real time."""
+
+    def __init__(self, frame_time=PHYSICS_STEP):
+        self.frame_time = frame_time
+
+    def __call__(self):
+        return self.frame_time
+
+
 class Game(object):
     base_enemy_spawn_delay = 500  # divided by current level
     base_level_length = 6000  # in milliseconds
@@ -378,34 +930,151 @@ class Game(object):
     background_color = DARK_GREEN
     show_hitboxes = False
     show_debug_info = False
+    # if True (and numpy is installed), enemies are updated in batches
+    numpy_enemies = True
+    # if True, only the parts of the screen that changed are updated
+    dirty_rect_rendering = True
+    # if True, sprites are drawn with one Surface.blits call per batch
+    # rather than a blit call each
+    batched_blits = True
+    # if set, the next game is recorded to / played back from this file
+    record_path = None
+    replay_path = None
+    # print how long starting up took, at the first menu frame
+    startup_report = False
+    # print the CPU time used per second on leaving each menu or wait
+    # screen
+    idle_report = False
+    # if set, every player is driven by this bot from controllers.BOTS
+    bot = None
+    # if True, the last few seconds are kept for rewinding (F7-F9)
+    rewind_enabled = True
+    # print how evenly frames were paced at the end of each game
+    pacing_report = False
     hotseat_multiplayer = False
     # if controls == '', player is not playing
     types_of_controls = ['wasd', 'arrows', 'tfgh', 'ijkl', 'numpad', '']
     # default controls for each player
     players_controls = ['wasd', 'arrows', 'tfgh', 'ijkl']
 
-    def __init__(self, screen):
+    def __init__(self, screen, highscores=None):
+        # highscores: a HighscoreStore to use instead of the player's, e.g.
+        # HighscoreStore(':memory:') for benchmarks
         self.screen = screen
-        self.clock = pygame.time.Clock()
+        self.clock = GameClock()
 
         self.background = pygame.Surface(screen.get_size()).convert()
         self.background.fill(BACKGROUND_COLOR)
-
-        # load highscores from data/highscores
-        try:
-            self.highscores = load_highscores()
-        except:
-            # get new highscores if it cannot load highscores
-            self.highscores = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
+        # parts of the screen changed this frame
+        self.dirty = DirtyRects(screen.get_rect())
+        # darkened layers over the scene for menus and game over
+        self.compositor = Compositor(screen, self.background)
+
+        # every score is saved to data/highscores.sqlite as it is made
+        if highscores is None:
+            highscores = open_highscores()
+        self.highscores = highscores
+
+        # keys that move the players, plus any control schemes defined in
+        # data/bindings.json
+        self.bindings = KeyBindings()
+        path = data_path('bindings.json')
+        if os.path.exists(path):
+            try:
+                custom = self.bindings.load(path)
+            except (OSError, ValueError) as message:
+                print('Cannot load key bindings:', message)
+            else:
+                # offer them in the options menu, before 'not playing'
+                self.types_of_controls = self.types_of_controls[:-1] + [
+                    c for c in custom if c not in self.types_of_controls
+                ] + ['']
+
+        self.recorder = None
+        self.replay = None
+        # replaced by a PhaseProfiler while profiling (F5)
+        self.profiler = NULL_PROFILER
+        # a snapshot of every recent frame, allocated once
+        self.rewind = RewindBuffer()
         self.init_game()
 
-    def init_game(self):
-        self.players = []
-        self.enemies = []
-        self.level = 1
+    def init_game(self, controls=(), seed=None,
+                  numpy_enemies=None):
+        # a new game; with no controls it has no players, which is what the
+        # menus use for their background enemies
+        if numpy_enemies is None:
+            numpy_enemies = self.numpy_enemies
+        self.simulation = Simulation(
+            controls, clock=self.tick, input_source=self,
+            numpy_enemies=numpy_enemies, seed=seed)
+        self.simulation.profiler = self.profiler
+        self.bindings.compile(self.simulation.players)
+        self.wants_exit = False
         # old textrects: used for filling background color
         self.old_textrects = []
+        # where the players and enemies were drawn last frame
+        self.sprite_rects = []
+        self.rewind.clear()
+        # while rewound (paused), how many frames back from the newest kept
+        # frame the game is; None while playing
+        self.rewind_back = None
+        # if True, the next frame is played even though rewound (F8)
+        self.step_once = False
+        # if True, the game is put back to rewind_back frames ago after
+        # this frame
+        self.rewind_pending = False
+
+    def tick(self):
+        # the clock for the simulation: time since the last frame, waiting
+        # so as not to run at more than MAX_FPS frames per second
+        self.time_since_last_frame = self.clock.tick(MAX_FPS)
+        if self.step_once:
+            # stepping while rewound plays exactly one physics step
+            self.time_since_last_frame = PHYSICS_STEP
+        self.replay_events = []
+        if self.replay:
+            # play back the recorded frame's time and keys instead
+            frame = self.replay.next_frame()
+            if frame is None:
+                self.time_since_last_frame = 0
+            else:
+                self.time_since_last_frame, self.replay_events = frame
+        return self.time_since_last_frame
+
+    def poll(self, simulation):
+        # the input source for the simulation: the keyboard
+        events = pygame.event.get()
+        for event in events:
+            if event.type in EXPOSE_EVENTS:
+                # this frame pushes the whole screen to the display
+                self.dirty.full()
+        if self.replay:
+            # ignore the real keyboard, apart from closing the window
+            events = [e for e in events if e.type == QUIT]
+            events += [pygame.event.Event(type, key=key)
+                       for type, key in self.replay_events]
+        if self.recorder:
+            self.recorder.record_frame(
+                self.time_since_last_frame,
+                [(e.type, e.key) for e in events
+                 if e.type in (KEYDOWN, KEYUP)])
+        if self.handle_keys(events) == "exit":
+            self.wants_exit = True
+
+    def end_session(self):
+        # finishes recording or playing back the current game, if any,
+        # and reports on its frame pacing if asked to
+        if self.pacing_report:
+            print(self.clock.report())
+        if self.recorder:
+            self.recorder.close(digest(self.simulation))
+            self.recorder = None
+        if self.replay:
+            if self.replay.matches(digest(self.simulation)):
+                print('Replay reproduced the recorded game exactly')
+            else:
+                print('Replay diverged from the recorded game')
+            self.replay = None
 
     def menu(self, title, options, title_size=50, option_size=25,
              enemies_background=True, option_selected=0):
@@ -415,13 +1084,13 @@ class Game(object):
         """
         x = WINDOW_WIDTH / 2
 
-        titlefont = pygame.font.Font(MENU_FONT, title_size)
+        titlefont = fonts.get(MENU_FONT, title_size)
         title_y = title_size / 2 + 30
         title = TextSprite(title, titlefont, x, title_y, RED)
 
         optioncolor = WHITE
         selectedoptioncolor = RED
-        optionfont = pygame.font.Font(MENU_FONT, option_size)
+        optionfont = fonts.get(MENU_FONT, option_size)
         space_below_title = title_size
         space_between_options = optionfont.get_height()
         option_sprites = []
@@ -435,46 +1104,113 @@ class Game(object):
             option_sprites.append(
                 TextSprite(options[i], optionfont, x, y, color))
 
-        spawntimer = pygame.time.Clock()
         spawntime = 0
-        screen_dimmer = Dimmer()
+
+        # the title and options, over the darkened background; only
+        # recomposed where an option changes color
+        layer = self.compositor.layer('menu', DIM_FILL)
+        layer.set('title', title.image, title.rect)
+        for i, option in enumerate(option_sprites):
+            layer.set(i, option.image, option.rect)
+        # parts of the screen to redraw this frame: all of it at first, as
+        # it holds whatever was there before the menu
+        rects = [self.screen.get_rect()]
 
         def update_option_sprites(option_sprites, old_option, new_option):
-            option_sprites[old_option].change_color(optioncolor)
-            option_sprites[new_option].change_color(selectedoptioncolor)
+            for i, color in ((old_option, optioncolor),
+                             (new_option, selectedoptioncolor)):
+                option = option_sprites[i]
+                option.change_color(color)
+                changed = layer.set(i, option.image, option.rect)
+                if changed:
+                    rects.append(changed)
+
+        def draw_enemies(screen, area):
+            # only the enemies overlapping area, which the screen is
+            # clipped to
+            enemies = list(self.simulation.enemies)
+            blits = ((enemies[i].image, enemies[i].rect) for i in
+                     area.collidelistall([e.rect for e in enemies]))
+            if self.batched_blits:
+                screen.blits(blits, 0)
+            else:
+                for blit in blits:
+                    screen.blit(*blit)
 
-        while 1:
-            time_since_last_frame = self.clock.tick(MAX_FPS)
-            # clear screen with backgroundcolor
-            screen_dimmer.undim()
-            self.screen.blit(self.background, (0, 0))
+        meter = CpuMeter()
+
+        def leave(choice):
+            if self.idle_report:
+                print(meter.report('menu %r' % title.text))
+            return choice
 
-            if enemies_background:
+        allow_events(MENU_EVENTS)
+        # frames are only drawn when enemies are due to move or something
+        # changed; in between, the menu sleeps until input arrives
+        self.clock.tick()
+        last_input = pygame.time.get_ticks()
+        frame_due = enemies_background
+        next_frame = None
+
+        while 1:
+            if frame_due:
+                time_since_last_frame = self.clock.tick()
+                frame_start = pygame.time.get_ticks()
+                if frame_start - last_input > MENU_IDLE_AFTER:
+                    next_frame = frame_start + 1000 / MENU_IDLE_FPS
+                else:
+                    next_frame = frame_start + 1000 / MAX_FPS
                 # draw background fanciness
                 # scrolling enemies
-                spawntime += spawntimer.tick()
+                enemies = self.simulation.enemies
+                spawntime += time_since_last_frame
                 if spawntime >= ENEMY_SPAWNDELAY:
                     spawntime -= ENEMY_SPAWNDELAY
                     x = WINDOW_WIDTH - 10
-                    y = random.randint(0, WINDOW_HEIGHT)
-                    speed = random.uniform(ENEMY_MIN_SPEED, ENEMY_MAX_SPEED)
-                    text = random.choice([str(random.randint(1, 1024))])
-                    self.enemies.append(
-                        TextEnemy(x, y, speed, self, text))
-                for object in self.enemies[:]:
-                    object.update(time_since_last_frame)
-                    self.screen.blit(object.image, object.rect)
-            # then, darken the screen without the title/options
-            screen_dimmer.dim(darken_factor=200)
-            title.draw(self.screen)
-            for option in option_sprites:
-                option.draw(self.screen)
-            # update display
-            pygame.display.update()
+                    rng = self.simulation.random
+                    y = rng.randint(0, WINDOW_HEIGHT)
+                    speed = rng.uniform(ENEMY_MIN_SPEED, ENEMY_MAX_SPEED)
+                    text = str(rng.randint(1, 1024))
+                    enemies.spawn(
+                        TextEnemy, x, y, speed, self.simulation, text)
+                # everything else looks the same as last frame, so only
+                # where enemies were and are now needs redrawing
+                for object in enemies:
+                    rects.append(object.rect.copy())
+                enemies.update(time_since_last_frame)
+                for object in enemies:
+                    rects.append(object.rect.copy())
+            if rects:
+                # the background, the enemies and the darkened title and
+                # options over them, only inside rects
+                self.dirty.add_all(self.compositor.draw(
+                    layer, rects,
+                    draw_enemies if enemies_background else None))
+                rects = []
+                # update display
+                self.update_display()
+            if not startup.done:
+                startup.finish('first menu frame')
+                if self.startup_report:
+                    print(startup.report())
+
+            # sleep until there is input or the next frame is due
+            if next_frame is None:
+                events = self.clock.wait_events()
+            else:
+                events = self.clock.wait_events(
+                    next_frame - pygame.time.get_ticks())
+            frame_due = next_frame is not None and (
+                not events or pygame.time.get_ticks() >= next_frame)
+
             # handle keys for menu
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == QUIT:
                     self.exit()
+                if event.type in EXPOSE_EVENTS:
+                    self.repaint()
+                if event.type in (KEYDOWN, MOUSEMOTION, MOUSEBUTTONDOWN):
+                    last_input = pygame.time.get_ticks()
 
                 if event.type == KEYDOWN:
                     if event.key == K_UP or event.key == ord('w'):
@@ -493,9 +1229,9 @@ class Game(object):
                             option_sprites, old_option, option_selected)
                     elif event.key == K_ESCAPE:  # pressing escape quits
 
-                        return "exit"
+                        return leave("exit")
                     elif event.key == K_RETURN:
-                        return option_selected
+                        return leave(option_selected)
 
                 elif event.type == MOUSEMOTION:
                     for option in option_sprites:
@@ -506,7 +1242,7 @@ class Game(object):
                                 option_sprites, old_option, option_selected)
                             break
                 elif event.type == MOUSEBUTTONDOWN:
-                    return option_selected
+                    return leave(option_selected)
 
     def main_menu(self):
         while 1:
@@ -528,7 +1264,8 @@ class Game(object):
                 self.exit()
 
     def exit(self):
-        save_highscores(self.highscores)
+        self.end_session()
+        self.highscores.close()
         terminate()
 
     def options_menu(self):
@@ -582,214 +1319,127 @@ class Game(object):
 
             option_selected = choice
 
-    def get_next_control_type(control_type):
+    def get_next_control_type(self, control_type):
         i = self.types_of_controls.index(control_type) - 1
         return self.types_of_controls[i]
 
-    def spawn_number_enemies(self):
-        x = WINDOW_WIDTH - 10
-        y = random.randint(0, WINDOW_HEIGHT)
-        speed = random.uniform(ENEMY_MIN_SPEED, ENEMY_MAX_SPEED)
-        text = random.choice([str(random.randint(1, 1024))])
-        if self.level >= 4:
-            # 1/10 chance of erratic movement from level 4 onward
-            erratic_movement = (1 == random.randint(1, 10))
-        else:
-            erratic_movement = False
-        if self.level >= 2:
-            # 1/10 chance of aimed movement from level 2 onward
-            aimed = (1 == random.randint(1, 10))
-        else:
-            aimed = False
-        if self.level >= 2:
-            # 1/4 chance of starting rotated from level 2 onward
-            start_rotated = (1 == random.randint(1, 4))
-        else:
-            start_rotated = False
-
-        self.enemies.append(TextEnemy(
-            x, y, speed, self,
-            text, erratic=erratic_movement, aimed=aimed,
-            rotated=start_rotated))
-
-        # spawn enemies on left to encourage player to run
-        # and to look cool
-        x = 10
-        y = random.randint(0, WINDOW_HEIGHT)
-        # fast as the average speed of an enemy
-        speed = (ENEMY_MAX_SPEED + ENEMY_MIN_SPEED) / 2
-        if self.level >= 3:
-            # after level 3, half of the left enemies move erratically
-            # this makes them look cooler and more terrifying
-            erratic_movement = (1 == random.randint(1, 2))
-        else:
-            erratic_movement = False
-
-        self.enemies.append(TextEnemy(
-            x, y, speed, self, text, erratic=erratic_movement))
-
-    def handle_keys(self):
-        for event in pygame.event.get():
+    def handle_keys(self, events):
+        for event in events:
             if event.type == QUIT:
                 self.exit()
 
+            if event.type == KEYUP and event.key == K_ESCAPE:
+                return 'exit'
+
+            if event.type in (KEYDOWN, KEYUP):
+                # moving a player
+                if self.bindings.dispatch(event):
+                    continue
+
             if event.type == KEYDOWN:
-                for player in self.players:
-                    if player.controls == 'all' or player.controls == 'wasd':
-                        if event.key == ord('a'):
-                            player.moveleft = 1
-                        if event.key == ord('d'):
-                            player.moveright = 1
-                        if event.key == ord('w'):
-                            player.moveup = 1
-                        if event.key == ord('s'):
-                            player.movedown = 1
-
-                    if player.controls == 'all' or player.controls == 'arrows':
-                        if event.key == K_LEFT:
-                            player.moveleft = 1
-                        if event.key == K_RIGHT:
-                            player.moveright = 1
-                        if event.key == K_UP:
-                            player.moveup = 1
-                        if event.key == K_DOWN:
-                            player.movedown = 1
-                    if player.controls == 'all' or player.controls == 'tfgh':
-                        if event.key == ord('f'):
-                            player.moveleft = 1
-                        if event.key == ord('h'):
-                            player.moveright = 1
-                        if event.key == ord('t'):
-                            player.moveup = 1
-                        if event.key == ord('g'):
-                            player.movedown = 1
-                    if player.controls == 'all' or player.controls == 'ijkl':
-                        if event.key == ord('j'):
-                            player.moveleft = 1
-                        if event.key == ord('l'):
-                            player.moveright = 1
-                        if event.key == ord('i'):
-                            player.moveup = 1
-                        if event.key == ord('k'):
-                            player.movedown = 1
-
-                    if player.controls == 'all' or player.controls == 'numpad':
-                        if event.key == K_KP4:
-                            player.moveleft = 1
-                        if event.key == K_KP6:
-                            player.moveright = 1
-                        if event.key == K_KP8:
-                            player.moveup = 1
-                        if event.key == K_KP2:
-                            player.movedown = 1
                 if event.key == K_F3:
                     # toggle showing debug info
                     self.show_debug_info = not(self.show_debug_info)
                 if event.key == K_F4:
-                    # toggle drawing hitboxes of enemies
+                    # toggle drawing the enemies' rects and the outline of
+                    # the players' hitboxes
                     self.show_hitboxes = not(self.show_hitboxes)
-
-            if event.type == KEYUP:
-                if event.key == K_ESCAPE:
-                    return 'exit'
-                for player in self.players:
-                    if player.controls == 'all' or player.controls == 'arrows':
-                        if event.key == K_LEFT:
-                            player.moveleft = 0
-                        if event.key == K_RIGHT:
-                            player.moveright = 0
-                        if event.key == K_UP:
-                            player.moveup = 0
-                        if event.key == K_DOWN:
-                            player.movedown = 0
-
-                    if player.controls == 'all' or player.controls == 'wasd':
-                        if event.key == ord('a'):
-                            player.moveleft = 0
-                        if event.key == ord('d'):
-                            player.moveright = 0
-                        if event.key == ord('w'):
-                            player.moveup = 0
-                        if event.key == ord('s'):
-                            player.movedown = 0
-
-                    if player.controls == 'all' or player.controls == 'tfgh':
-                        if event.key == ord('f'):
-                            player.moveleft = 0
-                        if event.key == ord('h'):
-                            player.moveright = 0
-                        if event.key == ord('t'):
-                            player.moveup = 0
-                        if event.key == ord('g'):
-                            player.movedown = 0
-
-                    if player.controls == 'all' or player.controls == 'ijkl':
-                        if event.key == ord('j'):
-                            player.moveleft = 0
-                        if event.key == ord('l'):
-                            player.moveright = 0
-                        if event.key == ord('i'):
-                            player.moveup = 0
-                        if event.key == ord('k'):
-                            player.movedown = 0
-
-                    if player.controls == 'all' or player.controls == 'numpad':
-                        if event.key == K_KP4:
-                            player.moveleft = 0
-                        if event.key == K_KP6:
-                            player.moveright = 0
-                        if event.key == K_KP8:
-                            player.moveup = 0
-                        if event.key == K_KP2:
-                            player.movedown = 0
+                if event.key == K_F5:
+                    # toggle timing the phases of each frame
+                    if self.profiler.enabled:
+                        self.profiler = NULL_PROFILER
+                    else:
+                        self.profiler = PhaseProfiler(PROFILE_PHASES)
+                    self.simulation.profiler = self.profiler
+                if event.key == K_F6 and self.profiler.enabled:
+                    # save the profiled frames
+                    path = 'profile-%d.csv' % time.time()
+                    self.profiler.write_csv(path)
+                    print('Frame profile written to', path)
+                if event.key in (K_F7, K_F8, K_F9) and self.can_rewind():
+                    self.handle_rewind_key(event)
+
+    def can_rewind(self):
+        # rewinding would make recordings and replays meaningless
+        return self.rewind_enabled and not (self.recorder or self.replay)
+
+    def handle_rewind_key(self, event):
+        # F7 pauses and goes back a frame (Shift+F7: a second), F8 goes
+        # forward a frame, F9 carries on playing from the frame shown
+        back = self.rewind_back
+        if event.key == K_F7:
+            jump = REWIND_JUMP if event.mod & KMOD_SHIFT else 1
+            back = min((back or 0) + jump, len(self.rewind) - 1)
+        elif event.key == K_F8 and back is not None:
+            if back == 0:
+                # past the newest kept frame: play a new one
+                self.step_once = True
+                return
+            back -= 1
+        elif event.key == K_F9 and back is not None:
+            # the frames after this one never happened
+            self.rewind.discard(back)
+            self.rewind_back = None
+            return
+        if back is None or back < 0:
+            return
+        # keys are read in the middle of a frame, so the game is put back
+        # once the frame is over, in play_frame()
+        self.rewind_back = back
+        self.rewind_pending = True
 
     def handle_game_over(self):
         # first, save highscore
-        # add score to highscores
-        self.highscores.append(self.score)
-        # sort highscores in descending order
-        self.highscores.sort(reverse=True)
-        # get rid of lowest highscore
-        self.highscores.pop(-1)
-
-        # dim screen
-        screen_dimmer = Dimmer()
-        screen_dimmer.dim(darken_factor=200)
-
-        # draw gameover text, including score
-        font = pygame.font.Font(GAME_OVER_FONT, 58)
-        draw_text('GAME OVER', font, self.screen, (WINDOW_WIDTH / 2),
-                  20, color=RED, position='center')
+        simulation = self.simulation
+        score = simulation.score
+        rank = self.highscores.add(
+            score, level=simulation.level,
+            players=len(simulation.controls),
+            duration=simulation.time / 1000.0)
+
+        # keep the game's last frame to put back afterwards
+        compositor = self.compositor
+        compositor.save()
+
+        # the gameover text, including score and highscores, composed on
+        # a darkened layer that is laid over the game's last frame
+        layer = compositor.layer('game over', DIM_FILL)
+        font = fonts.get(GAME_OVER_FONT, 58)
+        layer.set('title', *place_text(
+            'GAME OVER', font, (WINDOW_WIDTH / 2), 20, color=RED,
+            position='center'))
 
         # show highscores
-        draw_text('Score:' + str(self.score), font, self.screen,
-                  (WINDOW_WIDTH / 2), 110, color=WHITE, position='center')
+        layer.set('score', *place_text(
+            'Score:' + str(score), font, (WINDOW_WIDTH / 2), 110,
+            color=WHITE, position='center'))
         # render highscores in a smaller font
-        font = pygame.font.Font(GAME_OVER_FONT, 36)
-        draw_text('HIGHSCORES', font, self.screen, WINDOW_WIDTH / 2,
-                  150, color=WHITE, position='center')
-        for i in range(len(self.highscores)):
+        font = fonts.get(GAME_OVER_FONT, 36)
+        layer.set('highscores', *place_text(
+            'HIGHSCORES', font, WINDOW_WIDTH / 2, 150, color=WHITE,
+            position='center'))
+        for i, highscore in enumerate(self.highscores.top()):
             x = WINDOW_WIDTH / 2
             y = 180 + 30 * i
-            draw_text(
-                str(self.highscores[i]), font, self.screen, x, y,
-                color=WHITE, position='center')
-            if self.highscores[i] == self.score:
-                draw_text("YOU ->" + " " * len(str(self.highscores[i])),
-                          font, self.screen, x - 20, y + 10,
-                          color=WHITE, position='bottomright')
+            layer.set(i, *place_text(
+                str(highscore), font, x, y, color=WHITE,
+                position='center'))
+            if i == rank:
+                layer.set('you', *place_text(
+                    "YOU ->" + " " * len(str(highscore)), font, x - 20,
+                    y + 10, color=WHITE, position='bottomright'))
+        compositor.draw_over(layer)
 
         pygame.display.update()
         # wait 1 second to stop people accidentally skipping this screen
         time.sleep(1)
-        font = pygame.font.Font(GAME_OVER_FONT, 58)
+        font = fonts.get(GAME_OVER_FONT, 58)
         draw_text('Press Enter to play again.', font, self.screen,
                   WINDOW_WIDTH / 2, 60, color=WHITE, position='center')
         pygame.display.update()
         self.wait_for_keypress(certainkey=K_RETURN)
-        screen_dimmer.undim()
+        compositor.restore()
 
-        self.game_over = True
         self.init_game()
 
     def wait_for_keypress(self, certainkey=None):
@@ -797,170 +1447,358 @@ class Game(object):
         # clears the pygame events, ensuring it isn't going to register an old
         # keypress
         pygame.event.clear()
+        meter = CpuMeter()
         while True:
-            # 5 frames a second; nothing's moving, so it should be ok: the
-            # player won't notice
-            self.clock.tick(5)
-            for event in pygame.event.get():
+            # nothing's moving, so sleep until something happens
+            for event in self.clock.wait_events():
                 # if player tries to close the window, terminate everything
                 if event.type == QUIT:
                     self.exit()
+                if event.type in EXPOSE_EVENTS:
+                    self.repaint()
                 if event.type == KEYDOWN:
                     if event.key == K_ESCAPE:  # pressing escape quits
                         self.main_menu()
-                    elif certainkey is None:
-                        return  # all other keys just return
-                    elif event.key == certainkey:
+                    elif certainkey is None or event.key == certainkey:
+                        # all other keys just return, unless waiting for
+                        # a certain one
+                        if self.idle_report:
+                            print(meter.report('waiting for a key'))
                         return
 
+    def update_display(self):
+        # pushes the parts of the screen changed this frame to the display
+        if not self.dirty_rect_rendering:
+            self.dirty.full()
+        self.dirty.update()
+
+    def repaint(self):
+        # pushes the whole screen to the display, e.g. once the window is
+        # uncovered, as updates normally only push what changed
+        self.dirty.full()
+        self.update_display()
+
+    def draw_sprites(self, blits):
+        # blits each (surface, dest[, area]) in blits onto the screen and
+        # marks where they went as changed; returns those rects
+        if self.batched_blits:
+            rects = self.screen.blits(blits)
+        else:
+            rects = [self.screen.blit(*blit) for blit in blits]
+        self.dirty.add_all(rects)
+        return rects
+
     def run(self):
-        self.init_game()
+        self.start_game()
+        while self.play_frame():
+            pass
+
+    def start_game(self):
+        # sets up a new game, to be played with play_frame()
+        if self.hotseat_multiplayer:
+            controls = [c for c in self.players_controls if c != '']
+        else:
+            controls = ['all']
+        if self.bot:
+            controls = ['bot:' + self.bot] * len(controls)
+        seed = random.randrange(2 ** 32)
+        numpy_enemies = self.numpy_enemies
+        if self.replay_path:
+            self.replay = ReplayPlayer(self.replay_path)
+            self.replay_path = None
+            controls = self.replay.controls
+            seed = self.replay.seed
+            numpy_enemies = self.replay.numpy_enemies
+        elif self.record_path:
+            self.recorder = ReplayRecorder(
+                self.record_path, seed, controls, numpy_enemies)
+            self.record_path = None
+        self.init_game(controls, seed, numpy_enemies)
+        allow_events(GAME_EVENTS)
         # Blit everything to the screen
         self.screen.blit(self.background, (0, 0))
         pygame.display.update()
-        self.score = 0
-        self.spawntime = 0
-        self.clock.tick()
-        self.time_until_new_level = LEVEL_LENGTH
-        # sleep 1 millisecond at game start to prevent error when trying to
-        # divide by time_since_last_frame when it is zero
-        time.sleep(0.001)
-
-        if self.hotseat_multiplayer:
-            self.players = [Player(controls)
-                            for controls in self.players_controls
-                            if controls != '']
+        self.clock.reset()
+
+    def play_frame(self):
+        """Plays one frame of the current game.
+        Returns False once the game has ended."""
+        simulation = self.simulation
+        profiler = self.profiler
+        profiler.begin_frame()
+
+        # RENDER EVERYTHING
+        # erase the players and enemies where they were drawn last frame
+        background = self.background
+        self.draw_sprites(
+            (background, rect, rect) for rect in self.sprite_rects)
+        profiler.lap('render')
+
+        if self.rewind_back is None or self.step_once:
+            # read input and simulate the time that passed
+            simulation.frame()
+            # a single step leaves the game rewound, at the new newest frame
+            self.step_once = False
+            if self.can_rewind() and not simulation.game_over:
+                self.rewind.record(simulation.snapshot())
+            profiler.lap('rewind')
         else:
-            self.players = [Player()]
+            # rewound: keep reading the keys, but the game stands still
+            self.tick()
+            self.poll(simulation)
+        if self.rewind_pending:
+            self.rewind_pending = False
+            simulation.restore(self.rewind.get(self.rewind_back))
+        if self.wants_exit:  # exit to main menu
+            self.end_session()
+            self.main_menu()
+
+        # check if all players are dead or not
+        if simulation.game_over:
+            self.end_session()
+            # show game over screen
+            self.handle_game_over()
+            return False
+
+        if self.replay and self.replay.finished:
+            # the recording stopped without the game ending
+            self.end_session()
+            return False
+
+        for rect in self.old_textrects:
+            self.screen.blit(self.background, rect, rect)
+
+        self.dirty.add_all(self.old_textrects)
+        self.old_textrects = []
 
-        self.game_over = False
+        text_cache.begin_frame()
 
-        while not self.game_over:
-
-            # Make sure game doesn't run at more than MAX_FPS frames per second
-            self.time_since_last_frame = self.clock.tick(MAX_FPS)
-
-            event = self.handle_keys()
-            if event == "exit":  # exit to main menu
-                self.main_menu()
-
-            # check if player has hit an enemy using smaller hitbox
-            for player in self.players:
-                player_rect = player.rect.inflate(-14, -14)
-                if playertouchingenemy(player_rect, self.enemies):
-                    # first, clear the player's sprite with background
-                    self.screen.blit(self.background, player.rect, player.rect)
-                    self.players.remove(player)
-            # check if all players are dead or not
-            # check seperate from death check to stop starting with no
-            # players
-            if len(self.players) == 0:
-                # show game over screen
-                self.handle_game_over()
-                # break the loop
-                self.game_over = True
-            # new level if time
-            self.time_until_new_level -= self.time_since_last_frame
-            if self.time_until_new_level <= 0:
-                self.level += 1
-                self.time_until_new_level = LEVEL_LENGTH
-                # spawn 'new level' enemy
-                x = WINDOW_WIDTH - 10
-                y = random.randint(50, WINDOW_HEIGHT - 50)
-                speed = ENEMY_MAX_SPEED
-                text = "LEVEL " + str(self.level)
-                # new level enemy uses pygame default font, due to munro having
-                # bad hitbox at large sizes
-                enemyfont = pygame.font.Font(None, 50)
-                self.enemies.append(Enemy(
-                    x, y, speed, self, enemyfont.render(text, True, RED)))
-            # spawn enemies
-            self.spawntime += self.time_since_last_frame
-            # spawn enemies on right if SPAWN_DELAY time has passed
-            if self.spawntime >= ENEMY_SPAWNDELAY / math.sqrt(self.level):
-                self.spawntime -= ENEMY_SPAWNDELAY / math.sqrt(self.level)
-                self.score += 1
-                self.spawn_number_enemies()
-
-            # RENDER EVERYTHING
-            for player in self.players:
-                self.screen.blit(self.background, player.rect, player.rect)
-            for enemy in self.enemies:
-                self.screen.blit(self.background, enemy.rect, enemy.rect)
-            for player in self.players:
-                player.update(self.time_since_last_frame)
-
-            for rect in self.old_textrects:
-                self.screen.blit(self.background, rect, rect)
-
-            self.old_textrects = []
-
-            # draw score at top-middle of screen
-            font = pygame.font.Font(GUI_FONT, 20)
+        # draw score at top-middle of screen
+        font = fonts.get(GUI_FONT, 20)
+        self.old_textrects.append(
+            draw_text('Score:' + str(simulation.score), font,
+                      self.screen, WINDOW_WIDTH / 2, 20, color=RED,
+                      position='center')
+        )
+
+        if self.show_debug_info:  # show all debug info if enabled
+
+            # draw FPS at topright screen, averaged over the last few
+            # seconds
+            pacing = self.clock.stats()
             self.old_textrects.append(
-                draw_text('Score:' + str(self.score), font, self.screen,
-                          WINDOW_WIDTH / 2, 20, color=RED, position='center')
+                draw_text(
+                    'FPS:%d/%d' % (round(pacing['fps']), MAX_FPS),
+                    font, self.screen, WINDOW_WIDTH - 100, 10,
+                    color=WHITE, background=BLACK, position='topleft')
             )
 
-            if self.show_debug_info:  # show all debug info if enabled
+            # draw frame time: time it takes to render each frame, and how
+            # much frame times vary
+            self.old_textrects.append(
+                draw_text('FT:%.1f~%.1f' % (
+                    self.time_since_last_frame, pacing['jitter_ms']), font,
+                    self.screen, WINDOW_WIDTH - 100, 25,
+                    color=WHITE, background=BLACK,
+                    position='topleft')
+            )
 
-                # draw FPS at topright screen
-                fps = 1.0 / self.time_since_last_frame * 1000
-                self.old_textrects.append(
-                    draw_text(
-                        'FPS:' + str(int(fps)) + '/' + str(MAX_FPS),
-                        font, self.screen, WINDOW_WIDTH - 100, 10,
-                        color=WHITE, background=BLACK, position='topleft')
-                )
+            # draw number of enemies on topright, for debug
+            self.old_textrects.append(
+                draw_text("Numbers:" + str(len(simulation.enemies)),
+                          font, self.screen, WINDOW_WIDTH - 100, 40,
+                          color=WHITE, background=BLACK,
+                          position="topleft")
+            )
 
-                # draw frame time: time it takes to render each frame
-                self.old_textrects.append(
-                    draw_text('FT: ' + str(self.time_since_last_frame), font,
-                              self.screen, WINDOW_WIDTH - 100, 25,
-                              color=WHITE, background=BLACK,
-                              position='topleft')
-                )
+            # draw how many of the enemy rects tested against the players'
+            # hitboxes overlapped one, and so needed a mask test
+            self.old_textrects.append(
+                draw_text("Rects:%.1f%%" % (
+                    100.0 * simulation.candidates
+                    / max(1, simulation.rect_tests)), font,
+                    self.screen, WINDOW_WIDTH - 100, 55,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
 
-                # draw number of enemies on topright, for debug
-                self.old_textrects.append(
-                    draw_text("Numbers:" + str(len(self.enemies)), font,
-                              self.screen, WINDOW_WIDTH - 100, 40,
-                              color=WHITE, background=BLACK,
-                              position="topleft")
-                )
+            # draw how often a spawned number was already rendered
+            self.old_textrects.append(
+                draw_text("Glyphs:%d%%" % (
+                    100 * glyph_cache.hit_rate()), font,
+                    self.screen, WINDOW_WIDTH - 100, 70,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
+
+            # draw time saved last frame by not re-rendering text
+            self.old_textrects.append(
+                draw_text("Text:%dus" % (
+                    text_cache.saved_last_frame / 1000), font,
+                    self.screen, WINDOW_WIDTH - 100, 85,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
+
+            # draw the most enemies alive at once, and how often a spawn
+            # reused a dead enemy
+            enemies = simulation.enemies
+            self.old_textrects.append(
+                draw_text("Pool:%d %d%%" % (
+                    enemies.high_water, 100 * enemies.reuse_rate()), font,
+                    self.screen, WINDOW_WIDTH - 100, 100,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
 
-            # draw enemies in enemies
-            for enemy in self.enemies[:]:
-                enemy.update(self.time_since_last_frame)
-                if self.show_hitboxes:
-                    # draw slightly darker then background rectangle
-                    pygame.draw.rect(
-                        self.screen, COLLISION_RECT_COLOR, enemy.rect)
-            for enemy in self.enemies[:]:
-                self.screen.blit(enemy.image, enemy.rect)
+            # draw how many frames can be rewound (and how far back the
+            # game is, while rewound), and the memory they take up of the
+            # rewind buffer's
+            rewind = self.rewind
+            text = "Rewind:%d" % len(rewind)
+            if self.rewind_back is not None:
+                text += " -%d" % self.rewind_back
+            self.old_textrects.append(
+                draw_text(text, font, self.screen, WINDOW_WIDTH - 100, 115,
+                          color=WHITE, background=BLACK,
+                          position="topleft")
+            )
+            self.old_textrects.append(
+                draw_text("Mem:%.1f/%dMB" % (
+                    rewind.bytes_used / 2 ** 20,
+                    rewind.capacity_bytes() // 2 ** 20), font,
+                    self.screen, WINDOW_WIDTH - 100, 130,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
 
-            # draw player
-            for player in self.players:
-                self.screen.blit(player.image, player.rect)
-                if self.show_hitboxes:
-                    # draw player rect
-                    pygame.draw.rect(
-                        self.screen, WHITE, player.rect.inflate(-14, -14))
+            # draw how many pixel-exact collision tests the last frame
+            # needed, after the rect tests passed, and how many enemies
+            # have hit a player
+            self.old_textrects.append(
+                draw_text("Masks:%d Hits:%d" % (
+                    simulation.mask_tests, simulation.hits), font,
+                    self.screen, WINDOW_WIDTH - 100, 145,
+                    color=WHITE, background=BLACK,
+                    position="topleft")
+            )
 
-            # blit to screen
-            pygame.display.update()
+            # with bots, draw how many enemies the grid had them look at,
+            # compared to looking at every enemy, and how long building it
+            # took
+            grid = simulation.enemy_grid
+            if grid.queries:
+                self.old_textrects.append(
+                    draw_text("Grid:%d%% %dus" % (
+                        100 * grid.pruning_ratio(), grid.rebuild_time()),
+                        font, self.screen, WINDOW_WIDTH - 100, 160,
+                        color=WHITE, background=BLACK,
+                        position="topleft")
+                )
 
-            pygame.event.pump()
+            if profiler.enabled:
+                self.draw_profile(font)
+        profiler.lap('hud')
+
+        # draw enemies in enemies
+        if self.show_hitboxes:
+            for enemy in simulation.enemies:
+                # draw slightly darker then background rectangle
+                pygame.draw.rect(
+                    self.screen, COLLISION_RECT_COLOR, enemy.rect)
+        # and players over them; enemies straight from their container,
+        # as an EnemyStore draws from its arrays. Everything is drawn as
+        # far ahead of the last step as the clock is, so that sprites move
+        # smoothly even when a frame runs no step or two
+        alpha = simulation.physics.alpha()
+        self.sprite_rects = self.draw_sprites(itertools.chain(
+            simulation.enemies.sprites(simulation.physics.accumulator),
+            ((player.image, player.rect_ahead(alpha))
+             for player in simulation.players)))
+        if self.show_hitboxes:
+            for player in simulation.players:
+                # draw the outline of the player's hitbox
+                hitbox = player.hitbox()
+                points = [(hitbox.x + x, hitbox.y + y)
+                          for x, y in player.get_mask().outline()]
+                if len(points) > 1:
+                    pygame.draw.lines(self.screen, WHITE, True, points)
+
+        profiler.lap('render')
+
+        # blit to screen
+        self.dirty.add_all(self.old_textrects)
+        self.update_display()
+        profiler.lap('display')
+
+        pygame.event.pump()
+        profiler.end_frame()
+        return True
+
+    def draw_profile(self, font):
+        # draws the profiler's average time per phase and a histogram of
+        # frame times on the left of the screen
+        y = 40
+        for phase, ms in self.profiler.averages():
+            self.old_textrects.append(
+                draw_text('%s:%.2fms' % (phase, ms), font, self.screen,
+                          10, y, color=WHITE, background=BLACK,
+                          position='topleft')
+            )
+            y += 15
+        counts = self.profiler.histogram()
+        most = max(max(counts), 1)
+        area = Rect(10, y + 5, 8 * len(counts), 40)
+        pygame.draw.rect(self.screen, BLACK, area)
+        for i, count in enumerate(counts):
+            height = area.h * count // most
+            pygame.draw.rect(self.screen, WHITE, (
+                area.x + 8 * i + 1, area.bottom - height, 6, height))
+        self.old_textrects.append(area)
 
 
 def main():
+    # --record FILE records the first game played to FILE,
+    # --replay FILE plays back a game recorded with --record,
+    # --startup-report prints how long starting up took,
+    # --bot NAME lets a bot (random or avoid) play, for soak tests,
+    # --idle-report prints the CPU time used while in menus,
+    # --pacing MODE paces frames by sleeping (capped, the default), by
+    # sleeping then spinning (precise) or not at all (uncapped),
+    # --max-delta MS sets the longest a frame may count as taking,
+    # --pacing-report prints how evenly frames were paced after each game
+    opts, args = getopt.getopt(sys.argv[1:], '', [
+        'record=', 'replay=', 'startup-report', 'bot=', 'idle-report',
+        'pacing=', 'max-delta=', 'pacing-report'])
+    opts = dict(opts)
+    if opts.get('--pacing', 'capped') not in MODES:
+        sys.exit('unknown --pacing %r, try one of: %s'
+                 % (opts['--pacing'], ', '.join(MODES)))
+    startup.mark('import')
+
     # Initialise screen and window
     pygame.init()
+    startup.mark('pygame.init')
     screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     pygame.display.set_caption("The RNG")
-    pygame.display.set_icon(load_image('icon.gif')[0])
+    startup.mark('window')
+    warm_up()
+    pygame.display.set_icon(get_atlas().view('icon.gif'))
+    startup.mark('assets')
 
     game = Game(screen)
+    game.startup_report = '--startup-report' in opts
+    game.idle_report = '--idle-report' in opts
+    game.pacing_report = '--pacing-report' in opts
+    game.clock.mode = opts.get('--pacing', game.clock.mode)
+    if '--max-delta' in opts:
+        game.clock.max_delta = float(opts['--max-delta'])
+    game.record_path = opts.get('--record')
+    if opts.get('--bot') in BOTS:
+        game.bot = opts['--bot']
+    if '--replay' in opts:
+        game.replay_path = opts['--replay']
+        game.run()
     game.main_menu()
 
 
@@ -0,0 +1,77 @@
+"""Packing many small images into one Surface.
+
+The digit images and sprites are each only a few pixels, so keeping each
+as its own Surface costs more in per-Surface overhead than in pixels.
+An Atlas packs them into a single Surface; numbers are composed by blitting
+areas of it, and sprites are subsurface views into it.
+"""
+
+import pygame
+from pygame.locals import *
+
+
+class Atlas(object):
+
+    """Images packed into one Surface with per-pixel alpha.
+
+    images: dict of name -> Surface. Pixels matching an image's colorkey
+        become fully transparent in the atlas, so images with a colorkey
+        and images with per-pixel alpha can share it.
+    max_width: width at which a new row (shelf) of images is started.
+    padding: empty pixels between images, so areas never bleed together.
+    """
+
+    def __init__(self, images, max_width=256, padding=1):
+        self.rects = self.pack(images, max_width, padding)
+        width = max([r.right for r in self.rects.values()] + [1])
+        height = max([r.bottom for r in self.rects.values()] + [1])
+        surface = pygame.Surface((width, height), SRCALPHA)
+        surface.fill((0, 0, 0, 0))
+        for name, image in images.items():
+            if image.get_flags() & SRCALPHA:
+                # copy per-pixel alpha as it is, rather than blending it
+                # onto the transparent atlas
+                surface.blit(image, self.rects[name],
+                             special_flags=BLEND_RGBA_MAX)
+            else:
+                # colorkeyed pixels are skipped and stay transparent
+                surface.blit(image, self.rects[name])
+        if pygame.display.get_surface():
+            surface = surface.convert_alpha()
+        # run-length encode the transparent areas for faster blits
+        surface.set_alpha(255, RLEACCEL)
+        self.surface = surface
+        self.views = {}
+
+    @staticmethod
+    def pack(images, max_width, padding):
+        # shelf packing: tallest images first, left to right, in rows
+        rects = {}
+        x = y = shelf_height = 0
+        order = sorted(images, key=lambda n: (-images[n].get_height(), n))
+        for name in order:
+            w, h = images[name].get_size()
+            if x and x + w > max_width:
+                x = 0
+                y += shelf_height + padding
+                shelf_height = 0
+            rects[name] = Rect(x, y, w, h)
+            x += w + padding
+            shelf_height = max(shelf_height, h)
+        return rects
+
+    def rect(self, name):
+        """The area of the atlas holding the image called name."""
+        return self.rects[name]
+
+    def view(self, name):
+        """A Surface sharing the atlas's pixels for the image called
+        name. Don't draw on it."""
+        view = self.views.get(name)
+        if view is None:
+            view = self.surface.subsurface(self.rects[name])
+            self.views[name] = view
+        return view
+
+    def __contains__(self, name):
+        return name in self.rects
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+"""Survival statistics from many headless games.
+
+Plays seeded games of the Simulation, without a display or real-time
+waiting, with players driven by one of the bots in controllers.py, spread
+over a pool of processes (one per core by default). Each game's result is
+streamed back as it finishes and the lot are summed up in a report: levels
+reached, scores, what killed the players, and how many games were
+simulated per second.
+
+    python batch.py [--games N] [--processes N] [--seed N] [--players N]
+                    [--bot NAME] [--max-time SECONDS] [--set NAME=VALUE]...
+                    [--output FILE] [--python-enemies]
+
+--set overrides one of the game's tuning constants in every game, e.g.
+--set ENEMY_SPAWNDELAY=400 or --set AIMED_ODDS=2,5. With --output, every
+game's result is written to FILE as a line of JSON.
+"""
+
+import collections
+import getopt
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import TheRNG
+from controllers import BOTS
+from stats import percentile
+
+DEFAULT_GAMES = 1000
+DEFAULT_MAX_TIME = 600  # simulated seconds before a game is called off
+# games handed to a worker at a time
+CHUNK_SIZE = 8
+
+
+def parse_setting(setting):
+    # 'NAME=VALUE' -> (NAME, value), where value is a number or a tuple of
+    # numbers, as the game's constants are
+    name, value = setting.split('=', 1)
+    if not hasattr(TheRNG, name):
+        raise ValueError('TheRNG has no constant %r' % name)
+    numbers = [float(v) if '.' in v else int(v) for v in value.split(',')]
+    if len(numbers) == 1:
+        return name, numbers[0]
+    return name, tuple(numbers)
+
+
+def init_worker(settings):
+    # runs once in each worker process, before its first game
+    for name, value in settings:
+        setattr(TheRNG, name, value)
+
+
+def play(job):
+    """Plays one game to the end; returns its result as a dict."""
+    seed, controls, max_time, numpy_enemies = job
+    start = time.perf_counter()
+    simulation = TheRNG.Simulation(
+        controls, clock=TheRNG.FixedClock(), numpy_enemies=numpy_enemies,
+        seed=seed)
+    most_enemies = 0
+    while not simulation.game_over and simulation.time < max_time * 1000:
+        simulation.frame()
+        most_enemies = max(most_enemies, len(simulation.enemies))
+    if simulation.game_over:
+        # the last player's death ended the game
+        cause = simulation.deaths[-1][3]
+    else:
+        cause = 'timeout'
+    return {
+        'seed': seed,
+        'level': simulation.level,
+        'score': simulation.score,
+        'cause': cause,
+        'deaths': simulation.deaths,
+        'frames': simulation.frames,
+        'steps': simulation.steps,
+        'seconds': simulation.time / 1000.0,
+        'enemies_max': most_enemies,
+        'wall_seconds': time.perf_counter() - start,
+    }
+
+
+def report(results, wall_seconds, processes):
+    """Returns the summary of results as text."""
+    lines = []
+    n = len(results)
+    levels = sorted(r['level'] for r in results)
+    scores = sorted(r['score'] for r in results)
+    simulated = sum(r['seconds'] for r in results)
+    lines.append('%d games in %.1fs on %d processes: %.1f games/s, '
+                 '%.0fx real time' % (n, wall_seconds, processes,
+                                      n / wall_seconds,
+                                      simulated / wall_seconds))
+    for name, values in (('level', levels), ('score', scores)):
+        lines.append('%-6s mean %7.2f  p10 %5d  p50 %5d  p90 %5d  max %5d'
+                     % (name, sum(values) / float(n),
+                        percentile(values, 0.1), percentile(values, 0.5),
+                        percentile(values, 0.9), values[-1]))
+    lines.append('game length mean %.1fs, enemies on screen max %d' % (
+        simulated / n, max(r['enemies_max'] for r in results)))
+
+    lines.append('')
+    lines.append('reached level    games  survival')
+    reached = collections.Counter(levels)
+    alive = n
+    for level in range(1, levels[-1] + 1):
+        lines.append('%13d %8d %8.1f%%' % (level, alive, 100.0 * alive / n))
+        alive -= reached[level]
+
+    lines.append('')
+    lines.append('killed by            games')
+    causes = collections.Counter(r['cause'] for r in results)
+    for cause, count in causes.most_common():
+        lines.append('%-16s %9d %8.1f%%' % (cause, count, 100.0 * count / n))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    opts, args = getopt.getopt(argv, '', [
+        'games=', 'processes=', 'seed=', 'players=', 'bot=', 'max-time=',
+        'set=', 'output=', 'python-enemies'])
+    games = DEFAULT_GAMES
+    processes = os.cpu_count() or 1
+    base_seed = 0
+    players = 1
+    bot = 'avoid'
+    max_time = DEFAULT_MAX_TIME
+    settings = []
+    output = None
+    numpy_enemies = True
+    for opt, value in opts:
+        if opt == '--games':
+            games = int(value)
+        elif opt == '--processes':
+            processes = int(value)
+        elif opt == '--seed':
+            base_seed = int(value)
+        elif opt == '--players':
+            players = int(value)
+        elif opt == '--bot':
+            if value not in BOTS:
+                sys.exit('unknown bot %r, try one of: %s'
+                         % (value, ', '.join(BOTS)))
+            bot = value
+        elif opt == '--max-time':
+            max_time = float(value)
+        elif opt == '--set':
+            try:
+                settings.append(parse_setting(value))
+            except ValueError as message:
+                sys.exit('bad --set %r: %s' % (value, message))
+        elif opt == '--output':
+            output = value
+        elif opt == '--python-enemies':
+            numpy_enemies = False
+
+    controls = ['bot:' + bot] * players
+    jobs = [(base_seed + i, controls, max_time, numpy_enemies)
+            for i in range(games)]
+    results = []
+    out = open(output, 'w') if output else None
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(processes, init_worker, (settings,))
+    try:
+        # results arrive in the order games finish, not the order of seeds
+        for result in pool.imap_unordered(play, jobs, CHUNK_SIZE):
+            results.append(result)
+            if out:
+                out.write(json.dumps(result) + '\n')
+            if len(results) % 100 == 0 or len(results) == games:
+                elapsed = time.perf_counter() - start
+                sys.stderr.write('\r%d/%d games, %.1f games/s' % (
+                    len(results), games, len(results) / elapsed))
+    finally:
+        pool.close()
+        pool.join()
+        if out:
+            out.close()
+    sys.stderr.write('\n')
+    if not results:
+        return 1
+
+    print('bot = %s, players = %d' % (bot, players))
+    for name, value in settings:
+        print('%s = %r' % (name, value))
+    print(report(results, time.perf_counter() - start, processes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
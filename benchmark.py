@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+"""Frame-time benchmarks for The RNG.
+
+Each scenario drives the real Game (menus, spawning, updates, collisions
+and rendering) under the SDL dummy video driver for a fixed number of
+frames, with every frame simulating 1/60 s however long it took to run.
+Players are invincible so a scenario always runs to the end.
+
+    python benchmark.py [--frames N] [--scenario NAME]... [--output FILE]
+                        [--compare BASELINE] [--threshold FRACTION]
+                        [--python-enemies] [--full-updates] [--unbatched]
+
+Results are printed and, with --output, written as JSON. With --compare,
+each scenario's p95 frame time is checked against a previous run's JSON
+and the exit status is 1 if any got more than --threshold (default 0.1,
+i.e. 10%) slower.
+
+--unbatched draws sprites with a blit call each instead of batching them
+into Surface.blits calls; comparing a run with it against one without
+shows what batching saves:
+
+    python benchmark.py --unbatched --output per-call.json
+    python benchmark.py --compare per-call.json
+"""
+
+import gc
+import getopt
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+from pygame.locals import *
+
+import TheRNG
+from gameclock import FrameTimes
+from highscores import HighscoreStore
+from stats import percentile
+
+BENCHMARK_VERSION = 1
+DEFAULT_FRAMES = 600
+WARMUP_FRAMES = 600  # frames run before measuring, to fill the screen
+ALLOCATION_FRAMES = 60  # frames run again with tracemalloc on
+
+
+class BenchClock(object):
+
+    """Stands in for Game.clock: never waits, always says the same time
+    passed, and calls on_tick (if set) with the number of the frame."""
+
+    def __init__(self, frame_time=TheRNG.PHYSICS_STEP):
+        self.frame_time = frame_time
+        self.ticks = 0
+        self.on_tick = None
+        self.framerate = 0
+        self.frame_times = FrameTimes()
+
+    def tick(self, framerate=0):
+        self.ticks += 1
+        self.framerate = framerate
+        self.frame_times.add(int(self.frame_time * 1e6))
+        if self.on_tick:
+            self.on_tick(self.ticks)
+        return self.frame_time
+
+    def reset(self):
+        self.frame_times.clear()
+
+    def stats(self):
+        """Returns FrameTimes.stats() for the times tick() said passed,
+        as GameClock.stats() does."""
+        return self.frame_times.stats(
+            self.framerate and 1000.0 / self.framerate)
+
+    def wait_events(self, timeout=None):
+        # a timeout, straight away, unless there are events
+        return pygame.event.get()
+
+
+def summarize(frame_times_ns, enemy_counts):
+    times = sorted(t / 1e6 for t in frame_times_ns)
+    return {
+        'frames': len(times),
+        'mean_ms': sum(times) / len(times),
+        'p50_ms': percentile(times, 0.50),
+        'p95_ms': percentile(times, 0.95),
+        'p99_ms': percentile(times, 0.99),
+        'max_ms': times[-1],
+        'enemies_mean': sum(enemy_counts) / len(enemy_counts),
+        'enemies_max': max(enemy_counts),
+    }
+
+
+def gc_collections():
+    return sum(generation['collections'] for generation in gc.get_stats())
+
+
+def make_game(options):
+    # scores go to a throwaway store, not the player's
+    game = TheRNG.Game(pygame.display.get_surface(),
+                       highscores=HighscoreStore(':memory:'))
+    game.clock = BenchClock()
+    game.numpy_enemies = not options.get('python_enemies')
+    game.dirty_rect_rendering = not options.get('full_updates')
+    game.batched_blits = not options.get('unbatched')
+    return game
+
+
+class GameScenario(object):
+
+    """A game played at a fixed level.
+
+    flood: if set, the screen is kept topped up with this many enemies
+        (outside of the measured time).
+    bot: if set, the players are driven by this bot from controllers.BOTS.
+    """
+
+    def __init__(self, level=1, hotseat=False, hitboxes=False, flood=0,
+                 bot=None):
+        self.level = level
+        self.bot = bot
+        self.hotseat = hotseat
+        self.hitboxes = hitboxes
+        self.flood = flood
+
+    def setup(self, game):
+        game.hotseat_multiplayer = self.hotseat
+        game.players_controls = ['wasd', 'arrows', 'tfgh', 'ijkl']
+        game.show_hitboxes = self.hitboxes
+        game.bot = self.bot
+        game.start_game()
+        simulation = game.simulation
+        simulation.invincible = True
+        simulation.level = self.level
+        # stay on this level for the whole run
+        simulation.time_until_new_level = float('inf')
+        if self.flood:
+            for i in range(self.flood):
+                self.spawn(simulation, simulation.random.randint(
+                    0, TheRNG.WINDOW_WIDTH))
+        for i in range(WARMUP_FRAMES):
+            game.play_frame()
+            self.top_up(simulation)
+
+    def spawn(self, simulation, x):
+        rng = simulation.random
+        simulation.enemies.spawn(
+            TheRNG.TextEnemy, x, rng.randint(0, TheRNG.WINDOW_HEIGHT),
+            rng.uniform(TheRNG.ENEMY_MIN_SPEED, TheRNG.ENEMY_MAX_SPEED),
+            simulation, str(rng.randint(1, 1024)))
+
+    def top_up(self, simulation):
+        while len(simulation.enemies) < self.flood:
+            self.spawn(simulation, TheRNG.WINDOW_WIDTH - 10)
+
+    def run(self, game, frames):
+        """Plays frames frames; returns their times and enemy counts."""
+        times = []
+        counts = []
+        for i in range(frames):
+            start = time.perf_counter_ns()
+            game.play_frame()
+            times.append(time.perf_counter_ns() - start)
+            counts.append(len(game.simulation.enemies))
+            self.top_up(game.simulation)
+        return times, counts
+
+
+class MenuScenario(object):
+
+    """The main menu with its scrolling background, left alone."""
+
+    def setup(self, game):
+        self.run(game, WARMUP_FRAMES)
+
+    def run(self, game, frames):
+        times = []
+        counts = []
+        last = [None]
+
+        def on_tick(n):
+            now = time.perf_counter_ns()
+            if last[0] is not None:
+                times.append(now - last[0])
+                counts.append(len(game.simulation.enemies))
+            last[0] = now
+            if n == frames + 1:
+                # leave the menu
+                pygame.event.post(
+                    pygame.event.Event(KEYDOWN, key=K_RETURN))
+
+        game.clock.ticks = 0
+        game.clock.on_tick = on_tick
+        game.menu("THE RNG", ["Play", "Options", "Exit"],
+                  title_size=100, option_size=50)
+        game.clock.on_tick = None
+        return times[:frames], counts[:frames]
+
+
+SCENARIOS = {
+    'menu_idle': MenuScenario,
+    'level_1': lambda: GameScenario(level=1),
+    'level_10': lambda: GameScenario(level=10),
+    'level_30': lambda: GameScenario(level=30),
+    'flood_1000': lambda: GameScenario(level=1, flood=1000),
+    'hotseat_4': lambda: GameScenario(level=5, hotseat=True),
+    'hitboxes': lambda: GameScenario(level=10, hitboxes=True),
+    'bots_flood_300': lambda: GameScenario(level=10, hotseat=True,
+                                           flood=300, bot='avoid'),
+}
+
+
+def run_scenario(name, frames, options):
+    random.seed(name)  # the same game every run
+    scenario = SCENARIOS[name]()
+    game = make_game(options)
+    start = time.perf_counter()
+    scenario.setup(game)
+
+    collections = gc_collections()
+    times, counts = scenario.run(game, frames)
+    result = summarize(times, counts)
+    result['gc_collections'] = gc_collections() - collections
+
+    # allocations are measured separately, as tracing slows everything down
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    scenario.run(game, ALLOCATION_FRAMES)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['alloc_peak_kb'] = (peak - before) / 1024
+    result['alloc_net_kb'] = (after - before) / 1024
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Prints how results compare to baseline; returns the names of the
+    scenarios whose p95 frame time regressed by more than threshold."""
+    regressions = []
+    print('%-12s %10s %10s %8s' % ('scenario', 'base p95', 'p95', 'change'))
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        change = result['p95_ms'] / base['p95_ms'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-12s %8.2fms %8.2fms %+7.1f%%%s' % (
+            name, base['p95_ms'], result['p95_ms'], 100 * change, flag))
+    return regressions
+
+
+def main(argv):
+    opts, args = getopt.getopt(argv, '', [
+        'frames=', 'scenario=', 'output=', 'compare=', 'threshold=',
+        'python-enemies', 'full-updates', 'unbatched'])
+    frames = DEFAULT_FRAMES
+    names = []
+    output = baseline = None
+    threshold = 0.1
+    options = {}
+    for opt, value in opts:
+        if opt == '--frames':
+            frames = int(value)
+        elif opt == '--scenario':
+            if value not in SCENARIOS:
+                sys.exit('unknown scenario %r, try one of: %s'
+                         % (value, ', '.join(SCENARIOS)))
+            names.append(value)
+        elif opt == '--output':
+            output = value
+        elif opt == '--compare':
+            baseline = value
+        elif opt == '--threshold':
+            threshold = float(value)
+        else:
+            options[opt[2:].replace('-', '_')] = True
+
+    pygame.init()
+    pygame.display.set_mode((TheRNG.WINDOW_WIDTH, TheRNG.WINDOW_HEIGHT))
+
+    results = {
+        'version': BENCHMARK_VERSION,
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy_enemies': bool(TheRNG.EnemyStore) and
+        not options.get('python_enemies'),
+        'options': options,
+        'frames': frames,
+        'scenarios': {},
+    }
+    print('%-12s %8s %8s %8s %8s %8s %10s' % (
+        'scenario', 'p50', 'p95', 'p99', 'max', 'enemies', 'alloc peak'))
+    for name in names or SCENARIOS:
+        result = run_scenario(name, frames, options)
+        results['scenarios'][name] = result
+        print('%-12s %6.2fms %6.2fms %6.2fms %6.2fms %8d %8dkB' % (
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['max_ms'], result['enemies_max'],
+            result['alloc_peak_kb']))
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        with open(baseline) as file:
+            regressions = compare(results, json.load(file), threshold)
+        if regressions:
+            print('regressed: ' + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
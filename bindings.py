@@ -0,0 +1,106 @@
+"""Keys that move the players.
+
+Each player has a control scheme ('wasd', 'arrows', ...; 'all' means every
+scheme) naming four keys, for left, right, up and down. KeyBindings
+compiles the players' schemes into one dict from (event type, key) to what
+that event does, so handling a key event is a single lookup, however many
+players and schemes there are.
+
+Schemes beyond the built-in ones can be defined in a JSON file of
+    {"name": ["left key", "right key", "up key", "down key"], ...}
+using pygame's key names (e.g. "a", "left", "[4]").
+"""
+
+import json
+
+import pygame
+from pygame.locals import *
+
+# the Player attributes set while a scheme's keys are held, in order
+DIRECTIONS = ('moveleft', 'moveright', 'moveup', 'movedown')
+
+# scheme -> keys for left, right, up and down
+CONTROL_SCHEMES = {
+    'wasd': (K_a, K_d, K_w, K_s),
+    'arrows': (K_LEFT, K_RIGHT, K_UP, K_DOWN),
+    'tfgh': (K_f, K_h, K_t, K_g),
+    'ijkl': (K_j, K_l, K_i, K_k),
+    'numpad': (K_KP4, K_KP6, K_KP8, K_KP2),
+}
+
+# the only events let into the queue while playing, and in menus; the
+# rest (mouse motion, window events, ...) are dropped by SDL
+GAME_EVENTS = [QUIT, KEYDOWN, KEYUP]
+MENU_EVENTS = [QUIT, KEYDOWN, KEYUP, MOUSEMOTION, MOUSEBUTTONDOWN]
+# always let in: the window was uncovered, so all of it needs pushing to
+# the display again, not just the parts that changed
+EXPOSE_EVENTS = [VIDEOEXPOSE, WINDOWEXPOSED]
+
+
+def allow_events(types):
+    """Lets only events of types, and EXPOSE_EVENTS, into the event
+    queue."""
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(list(types) + EXPOSE_EVENTS)
+
+
+class KeyBindings(object):
+
+    """The control schemes, and the players they are compiled for."""
+
+    def __init__(self):
+        self.schemes = dict(CONTROL_SCHEMES)
+        # (event type, key) -> ((player, attribute, value), ...)
+        self.table = {}
+
+    def bind(self, scheme, keys):
+        """Defines (or redefines) scheme as the keys for left, right, up
+        and down."""
+        if len(keys) != len(DIRECTIONS):
+            raise ValueError('a control scheme needs %d keys, not %d'
+                             % (len(DIRECTIONS), len(keys)))
+        self.schemes[scheme] = tuple(keys)
+
+    def load(self, path):
+        """Binds the schemes in the JSON file at path. Returns their names,
+        in the order they were defined."""
+        with open(path) as file:
+            schemes = json.load(file)
+        for scheme, names in schemes.items():
+            keys = []
+            for name in names:
+                key = pygame.key.key_code(name)
+                if key == K_UNKNOWN:
+                    raise ValueError('unknown key %r in control scheme %r'
+                                     % (name, scheme))
+                keys.append(key)
+            self.bind(scheme, keys)
+        return list(schemes)
+
+    def compile(self, players):
+        """Builds the lookup table for players, replacing the last one."""
+        table = {}
+        for player in players:
+            if player.controls == 'all':
+                schemes = list(self.schemes.values())
+            elif player.controls in self.schemes:
+                schemes = [self.schemes[player.controls]]
+            else:
+                schemes = []
+            for keys in schemes:
+                for key, attribute in zip(keys, DIRECTIONS):
+                    for type, value in ((KEYDOWN, 1), (KEYUP, 0)):
+                        table.setdefault((type, key), []).append(
+                            (player, attribute, value))
+        self.table = dict((event, tuple(actions))
+                          for event, actions in table.items())
+
+    def dispatch(self, event):
+        """Applies a KEYDOWN or KEYUP event to the players it moves.
+        Returns True if it moved any."""
+        actions = self.table.get((event.type, event.key))
+        if actions is None:
+            return False
+        for player, attribute, value in actions:
+            setattr(player, attribute, value)
+        return True
@@ -0,0 +1,153 @@
+"""Drawing the screen as a scene with cached layers over it.
+
+Menus and the game over screen draw a darkened scene (the background and
+any moving enemies) with text on top. Rather than copying the screen and
+darkening it with a new full-screen Surface every frame, the darkening and
+the text are composed once into a Layer: a screen-sized Surface with
+per-pixel alpha, translucent where it only darkens and opaque where there
+is text. A frame then redraws the scene only where something moved and
+blits the layer back over just those parts.
+
+A Layer is only recomposed where its content changes: set() redraws the
+part of the layer under the item that changed (a menu option changing
+color, say), not the whole layer.
+
+Layers hold premultiplied alpha, so that text composed on a layer and laid
+over the scene looks exactly as text drawn over the darkened scene did,
+antialiased edges included.
+"""
+
+import pygame
+from pygame.locals import SRCALPHA, BLEND_PREMULTIPLIED
+
+from dirtyrects import merge_rects
+
+
+class Layer(object):
+
+    """A translucent fill with images drawn on top.
+
+    size: the layer's size, normally the screen's.
+    fill: RGBA color of the layer where there are no images; (0, 0, 0,
+        200) darkens what is under it to about a fifth of its brightness.
+        Premultiplied, which black always is.
+    """
+
+    def __init__(self, size, fill):
+        self.surface = pygame.Surface(size, SRCALPHA).convert_alpha()
+        self.fill = fill
+        # key -> (premultiplied image, rect, image as given), drawn in the
+        # order they were first set
+        self.items = {}
+        self.surface.fill(fill)
+        # number of times part of the layer was redrawn
+        self.recomposed = 0
+
+    def clear(self):
+        self.items = {}
+        self.surface.fill(self.fill)
+        self.recomposed += 1
+
+    def set(self, key, image, rect):
+        """Puts image at rect on the layer, in place of what key had before.
+        Returns the part of the layer that changed, or None if nothing
+        did."""
+        old = self.items.get(key)
+        rect = pygame.Rect(rect)
+        if old is not None and old[2] is image and old[1] == rect:
+            return None
+        original = image
+        if image.get_flags() & SRCALPHA:
+            # converted first, as premul_alpha() garbles Surfaces with
+            # padded rows, which is what fonts render (pygame 2.6)
+            image = image.convert_alpha().premul_alpha()
+        self.items[key] = image, rect, original
+        changed = rect if old is None else rect.union(old[1])
+        self.redraw(changed)
+        return changed
+
+    def blit(self, surface, rects):
+        # lays the layer over surface inside rects, which mustn't overlap
+        surface.blits([(self.surface, rect, rect, BLEND_PREMULTIPLIED)
+                       for rect in rects], 0)
+
+    def redraw(self, area):
+        # fills area and draws back every image overlapping it
+        self.surface.fill(self.fill, area)
+        clip = self.surface.get_clip()
+        self.surface.set_clip(area)
+        self.surface.blits([(image, rect, None, BLEND_PREMULTIPLIED)
+                            for image, rect, original in self.items.values()
+                            if rect.colliderect(area)], 0)
+        self.surface.set_clip(clip)
+        self.recomposed += 1
+
+
+class Compositor(object):
+
+    """Draws the screen: background, then a scene drawn by the caller, then
+    a Layer on top. Layers, and a copy of the screen for putting it back
+    after an overlay, are allocated once and reused.
+
+    screen: the display Surface.
+    background: a screen-sized Surface under everything.
+    """
+
+    def __init__(self, screen, background):
+        self.screen = screen
+        self.background = background
+        self.size = screen.get_size()
+        # name -> Layer
+        self.layers = {}
+        self.saved = pygame.Surface(self.size).convert()
+
+    def layer(self, name, fill):
+        """Returns the layer called name, emptied and filled with fill,
+        creating it the first time."""
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = Layer(self.size, fill)
+        else:
+            layer.fill = fill
+            layer.clear()
+        return layer
+
+    def draw(self, layer, rects, draw_scene=None):
+        """Redraws the screen inside rects: the background, then whatever
+        draw_scene(screen, area) draws, then layer over that. Returns the
+        rects redrawn, which may be bigger than rects.
+
+        draw_scene is called once for each rect redrawn, as area, with the
+        screen clipped to it, so should only draw what overlaps area:
+        anything drawn outside the rects would end up without the layer
+        over it.
+        """
+        screen = self.screen
+        # the layer is translucent, so must not be blitted twice anywhere
+        rects = merge_rects(rects, screen.get_rect())
+        screen.blits([(self.background, rect, rect) for rect in rects], 0)
+        if draw_scene is not None:
+            clip = screen.get_clip()
+            for rect in rects:
+                screen.set_clip(rect)
+                draw_scene(screen, rect)
+            screen.set_clip(clip)
+        layer.blit(screen, rects)
+        return rects
+
+    def draw_over(self, layer, rects=None):
+        """Blits layer over what is on the screen inside rects (everywhere
+        if rects is None), without redrawing what is under it."""
+        if rects is None:
+            rects = [self.screen.get_rect()]
+        else:
+            rects = merge_rects(rects, self.screen.get_rect())
+        layer.blit(self.screen, rects)
+
+    def save(self):
+        """Keeps a copy of the screen, for restore()."""
+        self.saved.blit(self.screen, (0, 0))
+
+    def restore(self):
+        """Puts back the screen as it was at the last save()."""
+        self.screen.blit(self.saved, (0, 0))
@@ -0,0 +1,170 @@
+"""Players driven by code instead of the keyboard.
+
+A controller is given a Player each frame, through its control(player,
+simulation) method, and sets the player's moveleft/moveright/moveup/
+movedown flags, just as the keyboard would. Simulation.frame() calls the
+controller of every player that has one, after polling its input source.
+
+Two bots are built in: RandomWalk, which wanders, and ThreatAvoider,
+which steers away from where nearby enemies are about to be. Both take a
+seed and make the same moves for the same seed and game.
+"""
+
+import random
+
+
+class Controller(object):
+
+    """Base class for controllers."""
+
+    def control(self, player, simulation):
+        """Sets player's move flags for this frame."""
+        raise NotImplementedError
+
+    @staticmethod
+    def steer(player, dx, dy):
+        # holds the keys for moving in direction (dx, dy), each -1, 0 or 1
+        player.moveleft = int(dx < 0)
+        player.moveright = int(dx > 0)
+        player.moveup = int(dy < 0)
+        player.movedown = int(dy > 0)
+
+
+class RandomWalk(Controller):
+
+    """Moves in a random direction (or stays still), picking a new one
+    every interval milliseconds."""
+
+    def __init__(self, seed=None, interval=400):
+        self.random = random.Random(seed)
+        self.interval = interval
+        self.next_turn = 0
+
+    def control(self, player, simulation):
+        if simulation.time < self.next_turn:
+            return
+        self.next_turn = simulation.time + self.interval
+        self.steer(player, self.random.randint(-1, 1),
+                   self.random.randint(-1, 1))
+
+
+# the nine ways a player can move, staying still first so that it wins
+# ties
+DIRECTIONS = [(0, 0)] + [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                         if dx or dy]
+
+
+class ThreatAvoider(Controller):
+
+    """Looks ahead a few moments and moves the way that keeps the player
+    furthest from where the nearby enemies will be, and off the walls.
+
+    Only enemies in the collision grid's cells near the player are looked
+    at, ones that can't come close are skipped after one test, and it only
+    thinks again every think_interval milliseconds (holding its keys in
+    between, as a person would), so hundreds of enemies on screen cost it
+    little.
+
+    seed: only used to break ties, so the bot doesn't get stuck.
+    horizons: how far ahead to look, in milliseconds, and how much each
+        matters.
+    friction: the game's FRICTION, for working out how the player moves.
+    think_interval: milliseconds between decisions.
+    """
+
+    wall_weight = 0.5
+    # the fastest enemies move this many pixels per millisecond
+    enemy_speed = 0.2
+    # enemies whose predicted gap to anywhere the player could reach is
+    # bigger than this are ignored
+    safe_distance = 48
+
+    def __init__(self, seed=None, horizons=((100, 1.0), (250, 0.5),
+                                            (500, 0.2)),
+                 friction=0.00667, think_interval=50):
+        self.random = random.Random(seed)
+        self.horizons = horizons
+        self.friction = friction
+        self.think_interval = think_interval
+        self.next_think = 0
+        self.motion = None
+
+    def player_motion(self, player, step):
+        # for each horizon: (coasting factor, pushing distance), such that
+        # after the horizon the player has moved velocity * coasting +
+        # direction * pushing, under the game's friction; this is the sum
+        # of a geometric series, worked out once
+        decay = (1 - self.friction) ** step
+        push = player.speed * step
+        motion = []
+        for horizon, weight in self.horizons:
+            n = horizon / step
+            coasting = decay * (1 - decay ** n) / (1 - decay)
+            pushing = push / (1 - decay) * (n - coasting)
+            motion.append((horizon, weight, coasting, pushing))
+        return motion
+
+    def control(self, player, simulation):
+        if simulation.time < self.next_think:
+            return
+        self.next_think = simulation.time + self.think_interval
+        if self.motion is None:
+            self.motion = self.player_motion(player, simulation.physics.step)
+        cx, cy = player.rect.center
+        vx, vy = player.movepos
+        area = player.area
+        reach = max(pushing for h, w, c, pushing in self.motion)
+        furthest = max(horizon for horizon, w, c, p in self.motion)
+
+        # the enemies that might get near, and where they will be
+        radius = reach + furthest * self.enemy_speed + self.safe_distance
+        near = simulation.enemies_near(
+            player.rect.inflate(2 * radius, 2 * radius))
+        threats = [[] for horizon in self.motion]
+        for enemy in near:
+            rect = enemy.rect
+            ex, ey = rect.center
+            evx, evy = enemy.movepos
+            half_w = rect.w / 2 + self.safe_distance
+            half_h = rect.h / 2 + self.safe_distance
+            for i, (horizon, weight, coasting, pushing) in \
+                    enumerate(self.motion):
+                fx = ex + evx * horizon
+                fy = ey + evy * horizon
+                px = cx + vx * coasting
+                py = cy + vy * coasting
+                if abs(fx - px) - half_w < pushing and \
+                        abs(fy - py) - half_h < pushing:
+                    threats[i].append(
+                        (fx, fy, rect.w / 2, rect.h / 2))
+
+        best = None
+        best_danger = None
+        for dx, dy in DIRECTIONS:
+            danger = 0.0
+            for (horizon, weight, coasting, pushing), near_threats in \
+                    zip(self.motion, threats):
+                px = cx + vx * coasting + dx * pushing
+                py = cy + vy * coasting + dy * pushing
+                # the walls stop the player
+                px = min(max(px, area.left), area.right)
+                py = min(max(py, area.top), area.bottom)
+                for fx, fy, half_w, half_h in near_threats:
+                    gap_x = max(0.0, abs(fx - px) - half_w)
+                    gap_y = max(0.0, abs(fy - py) - half_h)
+                    danger += weight / (gap_x * gap_x + gap_y * gap_y + 1)
+                edge = min(px - area.left, area.right - px,
+                           py - area.top, area.bottom - py)
+                danger += self.wall_weight * weight / (edge * edge + 1)
+            if best_danger is None or danger < best_danger or (
+                    danger == best_danger and self.random.random() < 0.5):
+                best = dx, dy
+                best_danger = danger
+        self.steer(player, *best)
+
+
+# bots by name, for command line options
+BOTS = {
+    'random': RandomWalk,
+    'avoid': ThreatAvoider,
+}
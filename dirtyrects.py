@@ -0,0 +1,102 @@
+"""Updating only the parts of the display that changed.
+
+Each frame, whatever is erased or drawn adds its rect here; at the end of
+the frame the rects are merged and only they are pushed to the display.
+When so much of the screen changed that updating it piece by piece would be
+slower, the whole display is flipped instead.
+"""
+
+import pygame
+
+
+def merge_rects(rects, bounds):
+    """Returns rects clipped to bounds, with overlapping rects replaced by
+    their union, so that no two of them overlap."""
+    merged = []
+    for rect in rects:
+        rect = bounds.clip(rect)
+        if not rect.w or not rect.h:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+class DirtyRects(object):
+
+    """Collects the rects changed during a frame and updates the display.
+
+    screen_rect: rect of the whole display.
+    full_threshold: fraction of the screen area above which the whole
+        display is flipped instead of updating the rects one by one.
+    """
+
+    def __init__(self, screen_rect, full_threshold=0.5):
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.full_threshold = full_threshold
+        self.rects = []
+        self.everything = False
+        # stats about the last update
+        self.last_area = 0
+        self.last_count = 0
+        self.full_updates = 0
+        self.partial_updates = 0
+
+    def add(self, rect):
+        self.rects.append(rect)
+
+    def add_all(self, rects):
+        self.rects.extend(rects)
+
+    def full(self):
+        """Updates the whole display this frame, whatever else changed."""
+        self.everything = True
+
+    def merged(self):
+        """Returns the dirty rects, clipped to the screen, with overlapping
+        rects replaced by their union."""
+        return merge_rects(self.rects, self.screen_rect)
+
+    def raw_area(self):
+        """Returns the total area of the dirty rects clipped to the screen,
+        counting overlaps once for each rect."""
+        clip = self.screen_rect.clip
+        area = 0
+        for rect in self.rects:
+            rect = clip(rect)
+            area += rect.w * rect.h
+        return area
+
+    def update(self):
+        """Pushes this frame's changes to the display and starts a new
+        frame."""
+        screen_area = self.screen_rect.w * self.screen_rect.h
+        limit = screen_area * self.full_threshold
+        rects = None
+        if self.everything:
+            area = screen_area
+        else:
+            # merging is quadratic in the number of rects, so first add up
+            # their areas and don't bother merging when that already calls
+            # for a flip. Most of the screen is covered at most twice (where
+            # a sprite was erased and drawn again), so the sum is allowed up
+            # to twice the limit before giving up on merging
+            area = self.raw_area()
+            if area <= 2 * limit:
+                rects = self.merged()
+                area = sum(rect.w * rect.h for rect in rects)
+        if rects is None or area > limit:
+            pygame.display.flip()
+            self.full_updates += 1
+            self.last_count = 1
+        else:
+            if rects:
+                pygame.display.update(rects)
+            self.partial_updates += 1
+            self.last_count = len(rects)
+        self.last_area = area
+        self.rects = []
+        self.everything = False
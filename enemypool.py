@@ -0,0 +1,133 @@
+"""A pool of Enemy objects, reused instead of reallocated.
+
+EnemyPool stands in for the plain list in Simulation.enemies when NumPy
+isn't used. Enemies that leave the screen are kept, with their Rects, and
+brought back by spawn() with new arguments instead of allocating new ones.
+
+Removing an enemy moves the last one into its place, so it costs the same
+however many enemies there are, but the order of the enemies changes:
+overlapping numbers may be drawn in a different order than they spawned.
+"""
+
+from math import copysign
+
+
+def rounded(x):
+    # x rounded to an int as Rect rounds floats: half away from zero
+    return int(x + copysign(0.5, x))
+
+
+class EnemyPool(object):
+
+    """Live enemies in a list, and dead ones kept for reuse.
+
+    Enemies need a reset method taking the same arguments as their
+    constructor, and an update(time_passed) method returning False once
+    they should be removed.
+    """
+
+    def __init__(self):
+        self.live = []
+        # class -> dead instances of it, ready to be reset
+        self.free = {}
+        self.created = 0
+        self.reused = 0
+        self.high_water = 0  # most enemies alive at once
+
+    def spawn(self, cls, *args, **kwargs):
+        """Adds an enemy of class cls, made with args and kwargs, reusing a
+        dead one if there is one. Returns it."""
+        free = self.free.get(cls)
+        if free:
+            enemy = free.pop()
+            enemy.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            enemy = cls(*args, **kwargs)
+            self.created += 1
+        self.append(enemy)
+        return enemy
+
+    def restore(self, cls, *args):
+        """Adds an enemy of class cls set up by its restore method, called
+        with args, as when loading a snapshot. Returns it."""
+        free = self.free.get(cls)
+        enemy = free.pop() if free else cls()
+        enemy.restore(*args)
+        self.append(enemy)
+        return enemy
+
+    def append(self, enemy):
+        enemy.pool_index = len(self.live)
+        self.live.append(enemy)
+        if len(self.live) > self.high_water:
+            self.high_water = len(self.live)
+
+    def remove(self, enemy):
+        """Removes enemy by moving the last enemy into its place."""
+        live = self.live
+        i = getattr(enemy, 'pool_index', None)
+        if i is None or i >= len(live) or live[i] is not enemy:
+            raise ValueError('enemy is not in the pool')
+        last = live.pop()
+        if last is not enemy:
+            live[i] = last
+            last.pool_index = i
+        enemy.pool_index = None
+        self.free.setdefault(type(enemy), []).append(enemy)
+
+    def colliding(self, rect):
+        """Returns the enemies whose rects collide with rect, in order."""
+        enemies = self.live
+        return [enemies[i] for i in
+                rect.collidelistall([enemy.rect for enemy in enemies])]
+
+    def sprites(self, ahead=0):
+        """Returns (image, rect or topleft) for every enemy, for drawing,
+        moved along their velocities by ahead milliseconds."""
+        if not ahead:
+            return ((enemy.image, enemy.rect) for enemy in self.live)
+        return ((enemy.image,
+                 (rounded(enemy.pos[0] + enemy.movepos[0] * ahead),
+                  rounded(enemy.pos[1] + enemy.movepos[1] * ahead)))
+                for enemy in self.live)
+
+    def motion(self):
+        """Returns the enemies, and their positions and velocities as flat
+        lists of x and y, as in snapshots."""
+        live = self.live
+        return (live, [c for enemy in live for c in enemy.pos],
+                [c for enemy in live for c in enemy.movepos])
+
+    def clear(self):
+        for enemy in self.live:
+            enemy.pool_index = None
+            self.free.setdefault(type(enemy), []).append(enemy)
+        self.live = []
+
+    def update(self, time_passed):
+        """Updates every enemy, removing the ones whose update returns
+        False."""
+        live = self.live
+        i = 0
+        while i < len(live):
+            enemy = live[i]
+            if enemy.update(time_passed):
+                i += 1
+            else:
+                # the last enemy is moved into slot i, so update it next
+                self.remove(enemy)
+
+    def reuse_rate(self):
+        """Fraction of spawns that reused a dead enemy."""
+        spawns = self.created + self.reused
+        return self.reused / spawns if spawns else 0.0
+
+    def __len__(self):
+        return len(self.live)
+
+    def __iter__(self):
+        return iter(self.live)
+
+    def __getitem__(self, index):
+        return self.live[index]
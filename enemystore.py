@@ -0,0 +1,222 @@
+"""Struct-of-arrays enemy storage, updated with NumPy.
+
+EnemyStore stands in for the plain list in Game.enemies: enemies are still
+appended, iterated and drawn as Enemy objects, but their positions,
+velocities, flags and rect sizes live in contiguous arrays so that a whole
+frame of movement is a handful of array operations instead of one
+Enemy.update call per number on screen.
+
+Writing the new positions back into every Enemy after each update would
+cost most of what that saves, so it is only done when something iterates
+over the enemies (bots, snapshots of the whole store, ...). Drawing,
+collisions and snapshots read the arrays instead, and only the enemies a
+collision test finds are brought up to date.
+
+Like EnemyPool, the store keeps the Enemy objects (and their Rects) of the
+enemies that left the screen, and spawn() resets them instead of
+allocating new ones.
+"""
+
+from operator import attrgetter
+
+import numpy
+
+# bits in EnemyStore.flags
+ERRATIC = 1
+AIMED = 2
+ROTATED = 4
+
+
+class EnemyStore(object):
+
+    """Enemies kept as rows of NumPy arrays.
+
+    jitter: the largest change in up/down velocity an erratic enemy gets per
+        update.
+    capacity: number of rows to allocate up front; grows by doubling.
+    seed: seed for the erratic jitter's random numbers.
+    """
+
+    def __init__(self, jitter, capacity=256, seed=None):
+        self.jitter = jitter
+        self.rng = numpy.random.default_rng(seed)
+        self.count = 0
+        self.objects = []
+        # True while the Enemy objects' pos, rect and movepos are behind
+        # the arrays
+        self.stale = False
+        # class -> dead instances of it, ready to be reset
+        self.free = {}
+        self.created = 0
+        self.reused = 0
+        self.high_water = 0  # most enemies alive at once
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.pos = numpy.zeros((capacity, 2))
+        self.vel = numpy.zeros((capacity, 2))
+        self.size = numpy.zeros((capacity, 2))
+        self.flags = numpy.zeros(capacity, dtype=numpy.uint8)
+
+    def _grow(self):
+        n = self.count
+        pos, vel, size, flags = self.pos, self.vel, self.size, self.flags
+        self._allocate(self.capacity * 2)
+        self.pos[:n] = pos[:n]
+        self.vel[:n] = vel[:n]
+        self.size[:n] = size[:n]
+        self.flags[:n] = flags[:n]
+
+    def spawn(self, cls, *args, **kwargs):
+        """Adds an enemy of class cls, made with args and kwargs, reusing a
+        dead one if there is one. Returns it."""
+        free = self.free.get(cls)
+        if free:
+            enemy = free.pop()
+            enemy.reset(*args, **kwargs)
+            self.reused += 1
+        else:
+            enemy = cls(*args, **kwargs)
+            self.created += 1
+        self.append(enemy)
+        return enemy
+
+    def restore(self, cls, *args):
+        """Adds an enemy of class cls set up by its restore method, called
+        with args, as when loading a snapshot. Returns it."""
+        free = self.free.get(cls)
+        enemy = free.pop() if free else cls()
+        enemy.restore(*args)
+        self.append(enemy)
+        return enemy
+
+    def append(self, enemy):
+        if self.count == self.capacity:
+            self._grow()
+        i = self.count
+        self.pos[i] = enemy.pos
+        self.vel[i] = enemy.movepos
+        self.size[i] = enemy.rect.w, enemy.rect.h
+        self.flags[i] = (ERRATIC * bool(enemy.erratic) |
+                         AIMED * bool(enemy.aimed) |
+                         ROTATED * bool(enemy.rotated))
+        self.objects.append(enemy)
+        self.count += 1
+        if self.count > self.high_water:
+            self.high_water = self.count
+
+    def colliding(self, rect):
+        """Returns the enemies whose rects collide with rect, in order."""
+        n = self.count
+        topleft = self._topleft()
+        right = topleft + self.size[:n]
+        hits = numpy.flatnonzero(
+            (topleft[:, 0] < rect.right) & (right[:, 0] > rect.left) &
+            (topleft[:, 1] < rect.bottom) & (right[:, 1] > rect.top) &
+            (self.size[:n, 0] > 0) & (self.size[:n, 1] > 0)).tolist()
+        for i in hits:
+            self._sync_one(i)
+        return [self.objects[i] for i in hits]
+
+    def sprites(self, ahead=0):
+        """Returns (image, topleft) for every enemy, for drawing, moved
+        along their velocities by ahead milliseconds."""
+        pos = self.pos[:self.count]
+        if ahead:
+            pos = pos + self.vel[:self.count] * ahead
+        return zip(map(attrgetter('image'), self.objects),
+                   self._topleft(pos).tolist())
+
+    def motion(self):
+        """Returns the enemies, and their positions and velocities as flat
+        lists of x and y, as in snapshots."""
+        n = self.count
+        return (self.objects, self.pos[:n].ravel().tolist(),
+                self.vel[:n].ravel().tolist())
+
+    def clear(self):
+        for enemy in self.objects:
+            self.free.setdefault(type(enemy), []).append(enemy)
+        self.objects = []
+        self.count = 0
+        self.stale = False
+
+    def update(self, time_passed):
+        """Moves every enemy by time_passed milliseconds and drops the ones
+        that have left the screen on the left."""
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+
+        erratic = numpy.flatnonzero(self.flags[:n] & ERRATIC)
+        if len(erratic):
+            vel[erratic, 1] += self.rng.uniform(
+                -self.jitter, self.jitter, len(erratic))
+
+        pos += vel * time_passed
+        alive = pos[:, 0] + self.size[:n, 0] > -5
+        if not alive.all():
+            self._compact(alive)
+        self.stale = True
+
+    def _compact(self, keep):
+        # drop every row where keep is False in one go, preserving order
+        # so that enemies are still drawn in the order they spawned
+        rows = numpy.flatnonzero(keep)
+        m = len(rows)
+        self.pos[:m] = self.pos[rows]
+        self.vel[:m] = self.vel[rows]
+        self.size[:m] = self.size[rows]
+        self.flags[:m] = self.flags[rows]
+        objects = self.objects
+        for i in numpy.flatnonzero(~keep).tolist():
+            enemy = objects[i]
+            self.free.setdefault(type(enemy), []).append(enemy)
+        self.objects = [objects[i] for i in rows.tolist()]
+        self.count = m
+
+    def reuse_rate(self):
+        """Fraction of spawns that reused a dead enemy."""
+        spawns = self.created + self.reused
+        return self.reused / spawns if spawns else 0.0
+
+    def _topleft(self, pos=None):
+        # the enemies' rects' topleft (or pos), rounded as Rect rounds
+        # floats: half away from zero
+        if pos is None:
+            pos = self.pos[:self.count]
+        return numpy.trunc(pos + numpy.copysign(0.5, pos)).astype(int)
+
+    def _sync_one(self, i):
+        enemy = self.objects[i]
+        x, y = self.pos[i].tolist()
+        enemy.pos = x, y
+        enemy.rect.x, enemy.rect.y = x, y
+        enemy.movepos[1] = self.vel[i, 1].item()
+
+    def sync(self):
+        """Writes the arrays back into the Enemy objects, if they have
+        changed since."""
+        if not self.stale:
+            return
+        n = self.count
+        for enemy, pos, vy in zip(self.objects, self.pos[:n].tolist(),
+                                  self.vel[:n, 1].tolist()):
+            enemy.pos = pos[0], pos[1]
+            enemy.rect.x, enemy.rect.y = pos
+            enemy.movepos[1] = vy
+        self.stale = False
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.sync()
+        return iter(self.objects)
+
+    def __getitem__(self, index):
+        self.sync()
+        return self.objects[index]
@@ -0,0 +1,240 @@
+"""The game's clock: frame times, and waiting for input in between.
+
+Menus and wait screens used to run a frame every 1/60 s (or 1/5 s) whether
+or not anything changed, which keeps a core busy while nobody is playing.
+GameClock.wait_events() instead sleeps until an event arrives or a timeout
+passes, so an idle screen only wakes for input and for the animation
+frames it has scheduled.
+
+SDL only truly sleeps in pygame.event.wait with the video drivers that can
+wake it up when input arrives (BLOCKING_DRIVERS); with the others (dummy,
+kmsdrm, ...) it checks for events every millisecond. With those,
+wait_events sleeps up to POLL_INTERVAL at a time between looking at the
+event queue instead, which is slower to notice input (by up to
+POLL_INTERVAL, or a frame while animating) but costs next to nothing.
+
+Frames are paced with time.perf_counter_ns rather than pygame's
+millisecond clock, so frame times are fractions of a millisecond and never
+0. GameClock.mode chooses how tick() waits for the next frame:
+
+    CAPPED      sleeps until the frame is due; the sleep may wake up a
+                little late, so frames come a little irregularly
+    PRECISE     sleeps until shortly before the frame is due, then spins
+                the rest of the way, like pygame's Clock.tick_busy_loop.
+                How long before is learnt from how late the sleeps wake
+                up, so it only spins as much as it has to
+    UNCAPPED    doesn't wait at all, for measuring how fast the game can
+                run
+
+Frames are due 1/framerate after the previous one was due, not after it
+ended, so the frame rate doesn't drift below framerate by the time the
+sleeps overshoot. A frame that runs late (a hitch) doesn't make the next
+ones hurry to catch up; instead the schedule starts again from it.
+"""
+
+import math
+import time
+from collections import deque
+
+import pygame
+from pygame.locals import NOEVENT
+
+from stats import percentile
+
+BLOCKING_DRIVERS = ('x11', 'wayland', 'windows', 'cocoa')
+POLL_INTERVAL = 50  # milliseconds
+
+CAPPED = 'capped'
+PRECISE = 'precise'
+UNCAPPED = 'uncapped'
+MODES = (CAPPED, PRECISE, UNCAPPED)
+
+# the longest frame time tick() returns, in milliseconds; after a longer
+# hitch (the window being dragged, say) the game carries on from where it
+# was instead of jumping ahead
+MAX_DELTA = 250
+# how long before a frame is due PRECISE mode starts spinning, in
+# nanoseconds, at first and at most
+SPIN_MARGIN = 2000000
+MAX_SPIN_MARGIN = 4000000
+MIN_SPIN_MARGIN = 200000
+
+
+class FrameTimes(object):
+
+    """The times of the last few frames, for measuring how evenly they are
+    paced.
+
+    history: number of frames to keep.
+    """
+
+    def __init__(self, history=600):
+        self.times = deque(maxlen=history)  # in nanoseconds
+        # frames whose time was cut down to the clock's max_delta
+        self.clamped = 0
+
+    def add(self, ns):
+        self.times.append(ns)
+
+    def clear(self):
+        self.times.clear()
+        self.clamped = 0
+
+    def stats(self, target=None):
+        """Returns a dict of the kept frames' count, frames per second and
+        mean, standard deviation (the jitter), 99th percentile and longest
+        frame time in milliseconds. Given the frame time aimed for (in
+        milliseconds), also how many frames were more than half a frame
+        late."""
+        times = sorted(self.times)
+        if not times:
+            return {'frames': 0, 'fps': 0.0, 'mean_ms': 0.0,
+                    'jitter_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0,
+                    'late': 0, 'clamped': self.clamped}
+        n = len(times)
+        mean = sum(times) / n
+        variance = sum((t - mean) ** 2 for t in times) / n
+        late = 0
+        if target:
+            late = n - sum(1 for t in times if t <= target * 1.5e6)
+        return {'frames': n, 'fps': 1e9 / mean, 'mean_ms': mean / 1e6,
+                'jitter_ms': math.sqrt(variance) / 1e6,
+                'p99_ms': percentile(times, 0.99) / 1e6,
+                'max_ms': times[-1] / 1e6, 'late': late,
+                'clamped': self.clamped}
+
+
+class GameClock(object):
+
+    """Stands in for pygame.time.Clock, adding wait_events() and a choice
+    of how to pace frames (see the module's docstring).
+
+    mode: CAPPED, PRECISE or UNCAPPED.
+    max_delta: the longest frame time tick() returns, in milliseconds, or
+        None for no limit.
+    """
+
+    def __init__(self, mode=CAPPED, max_delta=MAX_DELTA):
+        if mode not in MODES:
+            raise ValueError('unknown frame pacing %r, try one of: %s'
+                             % (mode, ', '.join(MODES)))
+        self.mode = mode
+        self.max_delta = max_delta
+        self.last = time.perf_counter_ns()
+        self.due = None  # when the last paced frame was due
+        self.framerate = 0
+        self.spin_margin = SPIN_MARGIN
+        self.frame_times = FrameTimes()
+        self.blocking = None  # worked out at the first wait
+        # times wait_events returned, and how many of those were timeouts
+        self.wakeups = 0
+        self.timeouts = 0
+
+    def tick(self, framerate=0):
+        """Returns the milliseconds since the last tick, first waiting so
+        as not to run at more than framerate ticks per second."""
+        now = time.perf_counter_ns()
+        if framerate and self.mode != UNCAPPED:
+            period = 1000000000 // framerate
+            if self.due is None or framerate != self.framerate:
+                due = self.last + period
+            else:
+                due = self.due + period
+            if due > now:
+                self.wait_until(due)
+                now = time.perf_counter_ns()
+            else:
+                # running late: start the schedule again from now
+                due = now
+            self.due = due
+        else:
+            self.due = None
+        self.framerate = framerate
+
+        ns = now - self.last
+        self.last = now
+        self.frame_times.add(ns)
+        ms = ns / 1e6
+        if self.max_delta is not None and ms > self.max_delta:
+            self.frame_times.clamped += 1
+            ms = self.max_delta
+        return ms
+
+    def wait_until(self, due):
+        # waits until perf_counter_ns() reaches due
+        if self.mode != PRECISE:
+            time.sleep((due - time.perf_counter_ns()) / 1e9)
+            return
+        sleep = due - time.perf_counter_ns() - self.spin_margin
+        if sleep > 0:
+            start = time.perf_counter_ns()
+            time.sleep(sleep / 1e9)
+            late = time.perf_counter_ns() - start - sleep
+            # spin for twice the latest oversleep, easing off slowly
+            self.spin_margin = min(MAX_SPIN_MARGIN, max(
+                MIN_SPIN_MARGIN, 2 * late, self.spin_margin * 15 // 16))
+        while time.perf_counter_ns() < due:
+            pass
+
+    def reset(self):
+        """Starts timing afresh, e.g. after a pause: the next tick returns
+        the time from now, and the kept frame times are dropped."""
+        self.last = time.perf_counter_ns()
+        self.due = None
+        self.frame_times.clear()
+
+    def stats(self):
+        """Returns FrameTimes.stats() for the recent frames, against the
+        frame rate last asked for."""
+        return self.frame_times.stats(
+            self.framerate and 1000.0 / self.framerate)
+
+    def report(self):
+        """Returns stats() as text."""
+        return ('%s pacing: %d frames, %.1f FPS, mean %.2fms, jitter %.2fms, '
+                'p99 %.2fms, max %.2fms, %d late, %d clamped'
+                % ((self.mode,) + tuple(self.stats()[key] for key in (
+                    'frames', 'fps', 'mean_ms', 'jitter_ms', 'p99_ms',
+                    'max_ms', 'late', 'clamped'))))
+
+    def wait_events(self, timeout=None):
+        """Waits until there is an event or timeout milliseconds have
+        passed (forever if timeout is None); returns the events that
+        arrived, an empty list on a timeout."""
+        if self.blocking is None:
+            self.blocking = pygame.display.get_driver() in BLOCKING_DRIVERS
+        if self.blocking:
+            events = self._wait(timeout)
+        else:
+            events = self._poll(timeout)
+        self.wakeups += 1
+        if not events:
+            self.timeouts += 1
+        return events
+
+    def _wait(self, timeout):
+        if timeout is None:
+            event = pygame.event.wait()
+        elif timeout <= 0:
+            # already due; wait(0) would wait for an event for ever
+            return pygame.event.get()
+        else:
+            event = pygame.event.wait(max(1, math.ceil(timeout)))
+        if event.type == NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    def _poll(self, timeout):
+        if timeout is not None:
+            deadline = pygame.time.get_ticks() + timeout
+        while True:
+            events = pygame.event.get()
+            if events:
+                return events
+            if timeout is None:
+                pygame.time.wait(POLL_INTERVAL)
+                continue
+            left = deadline - pygame.time.get_ticks()
+            if left <= 0:
+                return []
+            pygame.time.wait(int(min(left, POLL_INTERVAL)) or 1)
@@ -0,0 +1,94 @@
+"""A bounded cache of rendered number glyphs.
+
+Rendering a number means allocating a Surface, blitting a digit image per
+digit, scaling and maybe rotating the result. There are only so many
+numbers, scales and rotations, so each variant is rendered once and the
+same Surface is shared by every enemy showing it. Shared Surfaces must
+therefore never be drawn on.
+
+The same goes for the collision masks of the glyphs: each is made the
+first time a glyph is tested for an exact collision, and kept until the
+glyph is evicted.
+"""
+
+from collections import OrderedDict
+
+import pygame
+
+
+def surface_bytes(surface):
+    """Approximate memory used by a Surface's pixels."""
+    return surface.get_pitch() * surface.get_height()
+
+
+class GlyphCache(object):
+
+    """Least-recently-used cache of Surfaces keyed on (text, scale, rotation).
+
+    render: function called as render(text, scale, rotation) on a miss.
+    max_bytes: the most pixel memory the cache may hold before it evicts
+        the least recently used glyphs. The default holds every number the
+        game spawns (1-1024, two scales, four rotations: about 50MB at 32
+        bits per pixel), so in play nothing is ever rendered twice.
+    """
+
+    def __init__(self, render, max_bytes=64 * 1024 * 1024):
+        self.render = render
+        self.max_bytes = max_bytes
+        self.glyphs = OrderedDict()
+        # key -> pygame.mask.Mask of the glyph's opaque pixels
+        self.masks = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text, scale, rotation=0):
+        key = text, scale, rotation
+        glyph = self.glyphs.get(key)
+        if glyph is not None:
+            self.hits += 1
+            self.glyphs.move_to_end(key)
+            return glyph
+        self.misses += 1
+        glyph = self.render(text, scale, rotation)
+        self.glyphs[key] = glyph
+        self.bytes += surface_bytes(glyph)
+        while self.bytes > self.max_bytes and len(self.glyphs) > 1:
+            old_key, old_glyph = self.glyphs.popitem(last=False)
+            self.masks.pop(old_key, None)
+            self.bytes -= surface_bytes(old_glyph)
+            self.evictions += 1
+        return glyph
+
+    def mask(self, text, scale, rotation=0):
+        """Returns the mask of the glyph get() returns, for exact
+        collisions."""
+        key = text, scale, rotation
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = pygame.mask.from_surface(self.get(text, scale, rotation))
+            self.masks[key] = mask
+        return mask
+
+    def clear(self):
+        self.glyphs.clear()
+        self.masks.clear()
+        self.bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'glyphs': len(self.glyphs),
+            'masks': len(self.masks),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self):
+        return len(self.glyphs)
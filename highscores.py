@@ -0,0 +1,164 @@
+"""Highscores, kept in SQLite.
+
+Every finished game is written as it happens, as one row of an
+append-only table, so a crash loses nothing. Rows are never changed or
+deleted: the full history of each session (one run of the game) is kept
+for stats. The best scores are read through an index once on opening and
+then kept up to date in memory, so showing them costs nothing.
+
+The database uses a write-ahead log. Writing a score only appends to the
+log; folding the log back into the database (a checkpoint) is done by a
+background thread once the log has grown, never by the game's thread.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# a checkpoint is started once the write-ahead log is this big
+COMPACT_WAL_BYTES = 256 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL REFERENCES sessions(id),
+    score INTEGER NOT NULL,
+    level INTEGER,
+    players INTEGER,
+    duration REAL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores(score DESC);
+"""
+
+
+class HighscoreStore(object):
+
+    """The scores of every game played, and the best of them.
+
+    path: the database file, created if missing; ':memory:' keeps
+        everything in memory.
+    top: how many of the best scores to keep in memory.
+    """
+
+    def __init__(self, path, top=10):
+        self.path = path
+        self.size = top
+        self.db = sqlite3.connect(path)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+            # each commit is still atomic, it's just not fsynced until the
+            # next checkpoint
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            # checkpoints are left to compact()
+            self.db.execute('PRAGMA wal_autocheckpoint=0')
+        self.db.executescript(SCHEMA)
+        self.best = [row[0] for row in self.db.execute(
+            'SELECT score FROM scores ORDER BY score DESC LIMIT ?', (top,))]
+        # this session's row is only written with its first score, so
+        # opening the store to look at it writes nothing
+        self.session = None
+        self.started = time.time()
+        self.compactor = None
+
+    def add(self, score, level=None, players=None, duration=None):
+        """Saves the score of a finished game. Returns its place among the
+        best scores (0 is the best), or None if it isn't one of them."""
+        if self.session is None:
+            self.session = self.db.execute(
+                'INSERT INTO sessions (started) VALUES (?)',
+                (self.started,)).lastrowid
+        self.db.execute(
+            'INSERT INTO scores (session, score, level, players, duration,'
+            ' time) VALUES (?, ?, ?, ?, ?, ?)',
+            (self.session, score, level, players, duration, time.time()))
+        self.db.commit()
+        self.maybe_compact()
+
+        # scores that tie go below the older ones
+        rank = len(self.best)
+        for i, best in enumerate(self.best):
+            if score > best:
+                rank = i
+                break
+        if rank >= self.size:
+            return None
+        self.best.insert(rank, score)
+        del self.best[self.size:]
+        return rank
+
+    def end_session(self):
+        """Scores added after this go in a new session."""
+        self.session = None
+        self.started = time.time()
+
+    def top(self):
+        """The best scores, best first."""
+        return list(self.best)
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def history(self, session=None):
+        """(score, level, players, duration, time) of every game of session
+        (by default this one), oldest first."""
+        if session is None:
+            session = self.session
+        return self.db.execute(
+            'SELECT score, level, players, duration, time FROM scores'
+            ' WHERE session = ? ORDER BY id', (session,)).fetchall()
+
+    def stats(self, session=None):
+        """(games played, best score, mean score) of session (by default
+        this one)."""
+        if session is None:
+            session = self.session
+        games, best, mean = self.db.execute(
+            'SELECT COUNT(*), MAX(score), AVG(score) FROM scores'
+            ' WHERE session = ?', (session,)).fetchone()
+        return games, best or 0, mean or 0.0
+
+    def maybe_compact(self):
+        # starts a checkpoint in the background once the log has grown
+        try:
+            wal_size = os.path.getsize(self.path + '-wal')
+        except OSError:
+            return
+        if wal_size >= COMPACT_WAL_BYTES:
+            self.compact()
+
+    def compact(self):
+        """Folds the write-ahead log back into the database, on a
+        background thread. Does nothing if that is already happening."""
+        if self.path == ':memory:':
+            return
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self._checkpoint,
+                                          name='highscore compactor')
+        self.compactor.daemon = True
+        self.compactor.start()
+
+    def _checkpoint(self):
+        # a connection of its own, as connections can't be shared between
+        # threads; if the game is writing it waits, and any pages it misses
+        # are picked up by the next checkpoint
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            db.execute('PRAGMA optimize')
+        except sqlite3.Error:
+            pass
+        finally:
+            db.close()
+
+    def close(self):
+        if self.compactor is not None:
+            self.compactor.join()
+        # closing the last connection checkpoints what's left
+        self.db.close()
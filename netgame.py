@@ -0,0 +1,573 @@
+#!/usr/bin/python3
+"""Networked multiplayer: an authoritative server and its clients.
+
+The server runs the game (spawning, enemy updates, collisions, levels) in
+a Simulation that every connected client has a player in. Clients only
+send the keys they hold and draw what the server tells them.
+
+Messages are lines of JSON over TCP. Client to server:
+    {"t": "keys", "k": [left, right, up, down]}
+Server to client:
+    {"t": "welcome", "id": your player's id, "tick_rate": ticks a second}
+    {"t": "snap", ...}: the state of the game, once a tick (see Snapshotter)
+    {"t": "over", "score": score}: everyone died; a new game starts soon
+
+Snapshots are delta compressed. An enemy is sent in full ("new") once,
+with its velocity, and clients move it along that velocity themselves. It
+is only sent again ("move") when its velocity changes, as an erratic
+enemy's does, and only its serial number is sent ("gone") when it leaves.
+Players, whose movement clients can't predict, are sent every tick.
+
+    python netgame.py server [--host HOST] [--port N] [--tick-rate N]
+                             [--seed N]
+    python netgame.py client [--host HOST] [--port N]
+    python netgame.py bench [--clients N,...] [--enemies N,...] [--ticks N]
+
+bench runs a server and headless clients over localhost and reports how
+long a server tick takes with each number of clients and enemies.
+"""
+
+import asyncio
+import getopt
+import json
+import random
+import sys
+import time
+
+import pygame
+from pygame.locals import *
+
+import TheRNG
+from bindings import KeyBindings
+from stats import percentile
+
+DEFAULT_PORT = 4717
+DEFAULT_TICK_RATE = 30
+# longest message line, in bytes; a full snapshot of 1000 enemies is ~60kB
+MAX_MESSAGE = 1024 * 1024
+# a client that has fallen this many bytes behind is dropped, rather than
+# buffering for it forever
+MAX_BACKLOG = 1024 * 1024
+RESTART_DELAY = 3000  # milliseconds between game over and the next game
+# kinds of enemy in snapshots
+NUMBER, BANNER = 'n', 'b'
+
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+class Snapshotter(object):
+
+    """Builds the snapshots of a Simulation, remembering what was sent so
+    that each one only holds what changed since the last."""
+
+    def __init__(self):
+        # serial -> velocity of every enemy the clients know about
+        self.sent = {}
+        self.tick = 0
+
+    def reset(self):
+        self.sent = {}
+
+    def snapshot(self, simulation, full=False):
+        """Returns the delta snapshot since the last one, and, if full is
+        True, a full one as well (else None)."""
+        sent = self.sent
+        current = {}
+        new = []
+        move = []
+        everything = [] if full else None
+        for enemy in simulation.enemies:
+            serial = enemy.serial
+            x, y = enemy.pos
+            velocity = (round(enemy.movepos[0], 5),
+                        round(enemy.movepos[1], 5))
+            current[serial] = velocity
+            if serial not in sent or full:
+                if isinstance(enemy, TheRNG.TextEnemy):
+                    record = [serial, NUMBER, enemy.text, enemy.scale,
+                              enemy.angle]
+                else:
+                    record = [serial, BANNER, enemy.text, 0, 0]
+                record += [round(x, 1), round(y, 1)] + list(velocity)
+                if serial not in sent:
+                    new.append(record)
+                if full:
+                    everything.append(record)
+            elif sent[serial] != velocity:
+                move.append([serial, round(x, 1), round(y, 1)]
+                            + list(velocity))
+        gone = [serial for serial in sent if serial not in current]
+        self.sent = current
+        self.tick += 1
+
+        state = {
+            't': 'snap',
+            'tick': self.tick,
+            'time': simulation.time,
+            'level': simulation.level,
+            'score': simulation.score,
+            'players': [[player.net_id, round(player.pos[0], 1),
+                         round(player.pos[1], 1)]
+                        for player in simulation.players],
+        }
+        delta = dict(state, new=new, move=move, gone=gone)
+        if full:
+            full = dict(state, new=everything, move=[], gone=[], full=1)
+        else:
+            full = None
+        return delta, full
+
+
+class Connection(object):
+
+    """A client connected to the server."""
+
+    def __init__(self, id, writer):
+        self.id = id
+        self.writer = writer
+        self.player = None
+        # True until the client has been sent a full snapshot
+        self.needs_full = True
+
+    def send(self, data):
+        # never waits: a client that can't keep up is dropped instead
+        if self.writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+            raise ConnectionError('client %d fell behind' % self.id)
+        self.writer.write(data)
+
+
+class GameServer(object):
+
+    """Runs a game for every client connected, tick_rate ticks a second.
+
+    seed: seed for the seeds of the games played.
+    """
+
+    def __init__(self, tick_rate=DEFAULT_TICK_RATE, seed=None,
+                 numpy_enemies=True):
+        self.tick_rate = tick_rate
+        self.random = random.Random(seed)
+        self.numpy_enemies = numpy_enemies
+        self.clients = {}
+        self.next_id = 1
+        self.simulation = None
+        self.snapshotter = Snapshotter()
+        self.restart_in = 0
+        self.server = None
+        self.ticker = None
+        self.handlers = set()
+        # for the benchmark: time taken by the last tick, in ns, and bytes
+        # sent in it, per client
+        self.tick_ns = 0
+        self.tick_bytes = 0
+
+    async def start(self, host='', port=DEFAULT_PORT, run=True):
+        """Starts listening; with run, also starts ticking. Returns the
+        port listened on (port 0 picks a free one)."""
+        self.server = await asyncio.start_server(
+            self.handle_client, host, port, limit=MAX_MESSAGE)
+        if run:
+            self.ticker = asyncio.ensure_future(self.run())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.ticker:
+            self.ticker.cancel()
+        for client in list(self.clients.values()):
+            self.drop(client)
+        self.server.close()
+        # let the clients' handlers see their connections close
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=5)
+        await self.server.wait_closed()
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        interval = 1.0 / self.tick_rate
+        last = next_tick = loop.time()
+        while True:
+            next_tick += interval
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            now = loop.time()
+            self.tick((now - last) * 1000)
+            last = now
+            if now - next_tick > interval:
+                # too far behind to catch up; the simulation limits how
+                # much time one tick simulates anyway
+                next_tick = now
+
+    def new_game(self):
+        self.simulation = TheRNG.Simulation(
+            (), numpy_enemies=self.numpy_enemies,
+            seed=self.random.getrandbits(32))
+        self.snapshotter.reset()
+        for client in self.clients.values():
+            self.add_player(client)
+
+    def add_player(self, client):
+        player = TheRNG.Player('net')
+        player.net_id = client.id
+        client.player = player
+        client.needs_full = True
+        self.simulation.players.append(player)
+
+    def tick(self, time_passed):
+        """Simulates time_passed milliseconds and sends everyone the
+        result."""
+        start = time.perf_counter_ns()
+        if not self.clients:
+            return
+        simulation = self.simulation
+        if simulation is None or simulation.game_over:
+            self.restart_in -= time_passed
+            if simulation is not None and self.restart_in > 0:
+                return
+            self.new_game()
+            simulation = self.simulation
+
+        simulation.advance(time_passed)
+        if simulation.game_over:
+            self.restart_in = RESTART_DELAY
+            self.broadcast(encode({'t': 'over', 'score': simulation.score}))
+        else:
+            needs_full = set(c for c in self.clients.values()
+                             if c.needs_full)
+            delta, full = self.snapshotter.snapshot(
+                simulation, full=bool(needs_full))
+            delta = encode(delta)
+            self.tick_bytes = len(delta)
+            for client in needs_full:
+                client.needs_full = False
+            full = encode(full) if full else None
+            for client in list(self.clients.values()):
+                if client in needs_full:
+                    self.send(client, full)
+                else:
+                    self.send(client, delta)
+        self.tick_ns = time.perf_counter_ns() - start
+
+    def broadcast(self, data):
+        for client in list(self.clients.values()):
+            self.send(client, data)
+
+    def send(self, client, data):
+        try:
+            client.send(data)
+        except (ConnectionError, OSError) as message:
+            print('Dropping client:', message)
+            self.drop(client)
+
+    def drop(self, client):
+        if self.clients.pop(client.id, None) is None:
+            return
+        simulation = self.simulation
+        if simulation and client.player in simulation.players:
+            simulation.players.remove(client.player)
+        client.writer.close()
+
+    async def handle_client(self, reader, writer):
+        handler = asyncio.current_task()
+        self.handlers.add(handler)
+        client = Connection(self.next_id, writer)
+        self.next_id += 1
+        self.clients[client.id] = client
+        self.send(client, encode({'t': 'welcome', 'id': client.id,
+                                  'tick_rate': self.tick_rate}))
+        if self.simulation and not self.simulation.game_over:
+            self.add_player(client)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if not isinstance(message, dict):
+                    # valid JSON, but not a message
+                    continue
+                player = client.player
+                if message.get('t') == 'keys' and player is not None:
+                    player.moveleft, player.moveright, player.moveup, \
+                        player.movedown = [int(bool(k))
+                                           for k in message['k'][:4]]
+        except (ConnectionError, ValueError, KeyError, TypeError):
+            pass
+        finally:
+            self.drop(client)
+            self.handlers.discard(handler)
+
+
+class GameClient(object):
+
+    """Connects to a GameServer, sends it keys and keeps a copy of the
+    game from its snapshots."""
+
+    def __init__(self):
+        self.id = None
+        self.tick_rate = None
+        # serial -> [kind, text, scale, angle, x, y, vx, vy, time of x, y]
+        self.enemies = {}
+        self.players = {}  # id -> (x, y)
+        self.time = 0  # the game's time at the last snapshot
+        self.received_at = 0  # our time.perf_counter() when it came
+        self.tick = 0
+        self.level = 1
+        self.score = 0
+        self.last_score = None  # of the last game, once it's over
+        self.bytes_received = 0
+        self.reader = self.writer = None
+
+    async def connect(self, host, port=DEFAULT_PORT):
+        self.reader, self.writer = await asyncio.open_connection(
+            host, port, limit=MAX_MESSAGE)
+
+    async def receive(self):
+        """Applies messages from the server until it disconnects."""
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            self.bytes_received += len(line)
+            self.apply(json.loads(line))
+
+    def apply(self, message):
+        kind = message['t']
+        if kind == 'welcome':
+            self.id = message['id']
+            self.tick_rate = message['tick_rate']
+        elif kind == 'over':
+            self.last_score = message['score']
+        elif kind == 'snap':
+            now = message['time']
+            if message.get('full'):
+                self.enemies.clear()
+            for serial, kind, text, scale, angle, x, y, vx, vy in \
+                    message['new']:
+                self.enemies[serial] = [kind, text, scale, angle,
+                                        x, y, vx, vy, now]
+            for serial, x, y, vx, vy in message['move']:
+                enemy = self.enemies.get(serial)
+                if enemy is not None:
+                    enemy[4:] = [x, y, vx, vy, now]
+            for serial in message['gone']:
+                self.enemies.pop(serial, None)
+            self.players = dict((id, (x, y))
+                                for id, x, y in message['players'])
+            self.time = now
+            self.received_at = time.perf_counter()
+            self.tick = message['tick']
+            self.level = message['level']
+            self.score = message['score']
+
+    def send_keys(self, left, right, up, down):
+        self.writer.write(encode({'t': 'keys',
+                                  'k': [left, right, up, down]}))
+
+    def enemy_positions(self, at=None):
+        """Yields (serial, enemy record, x, y) of every enemy, moved along
+        its velocity to the game time at (by default the last snapshot's
+        time)."""
+        if at is None:
+            at = self.time
+        for serial, enemy in self.enemies.items():
+            elapsed = at - enemy[8]
+            yield (serial, enemy, enemy[4] + enemy[6] * elapsed,
+                   enemy[5] + enemy[7] * elapsed)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+class Keys(object):
+
+    """Stands in for a Player for KeyBindings, holding the keys pressed."""
+
+    controls = 'all'
+
+    def __init__(self):
+        self.moveleft = self.moveright = self.moveup = self.movedown = 0
+
+    def held(self):
+        return [self.moveleft, self.moveright, self.moveup, self.movedown]
+
+
+async def play(host, port):
+    """Plays on the server at host:port in a window, until it is closed."""
+    pygame.init()
+    screen = pygame.display.set_mode(
+        (TheRNG.WINDOW_WIDTH, TheRNG.WINDOW_HEIGHT))
+    pygame.display.set_caption("The RNG - %s:%d" % (host, port))
+    TheRNG.warm_up()
+    client = GameClient()
+    await client.connect(host, port)
+    receiver = asyncio.ensure_future(client.receive())
+
+    keys = Keys()
+    bindings = KeyBindings()
+    bindings.compile([keys])
+    sent = keys.held()
+    player_image = TheRNG.get_atlas().view('player.png')
+    font = TheRNG.fonts.get(TheRNG.GUI_FONT, 20)
+    try:
+        while not receiver.done():
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    return
+                if event.type in (KEYDOWN, KEYUP):
+                    if event.key == K_ESCAPE:
+                        return
+                    bindings.dispatch(event)
+            if keys.held() != sent:
+                sent = keys.held()
+                client.send_keys(*sent)
+
+            # draw the enemies where they will have got to by now
+            now = client.time + min(
+                time.perf_counter() - client.received_at, 0.2) * 1000
+            screen.fill(TheRNG.BACKGROUND_COLOR)
+            for serial, enemy, x, y in client.enemy_positions(now):
+                kind, text, scale, angle = enemy[:4]
+                if kind == NUMBER:
+                    image = TheRNG.render_number(text, scale, angle)
+                else:
+                    image = TheRNG.text_cache.render(
+                        TheRNG.fonts.get(None, 50), text, TheRNG.RED)
+                screen.blit(image, (x, y))
+            for id, position in client.players.items():
+                screen.blit(player_image, position)
+            TheRNG.draw_text(
+                'Level %d  Score %d  Players %d' % (
+                    client.level, client.score, len(client.players)),
+                font, screen, 10, 10, color=TheRNG.WHITE)
+            if client.id not in client.players:
+                message = 'Waiting for the next game'
+                if client.last_score is not None:
+                    message = 'Game over, score %d. %s' % (
+                        client.last_score, message)
+                TheRNG.draw_text(message, font, screen,
+                                 TheRNG.WINDOW_WIDTH / 2,
+                                 TheRNG.WINDOW_HEIGHT / 2,
+                                 color=TheRNG.WHITE, position='center')
+            pygame.display.flip()
+            await asyncio.sleep(1.0 / TheRNG.MAX_FPS)
+    finally:
+        receiver.cancel()
+        client.close()
+        pygame.quit()
+
+
+async def bench_one(clients, enemies, ticks, tick_rate):
+    # one run of the benchmark; returns its results as a dict
+    server = GameServer(tick_rate=tick_rate, seed=0)
+    port = await server.start('127.0.0.1', 0, run=False)
+    bots = []
+    for i in range(clients):
+        bot = GameClient()
+        await bot.connect('127.0.0.1', port)
+        bots.append((bot, asyncio.ensure_future(bot.receive())))
+    while len(server.clients) < clients:
+        await asyncio.sleep(0.01)
+
+    rng = random.Random(0)
+    time_passed = 1000.0 / tick_rate
+    times = []
+    sizes = []
+    for i in range(ticks):
+        simulation = server.simulation
+        if simulation is not None:
+            simulation.invincible = True
+            simulation.level = 10
+            simulation.time_until_new_level = float('inf')
+            while len(simulation.enemies) < enemies:
+                simulation.enemies.spawn(
+                    TheRNG.TextEnemy, rng.randint(0, TheRNG.WINDOW_WIDTH),
+                    rng.randint(0, TheRNG.WINDOW_HEIGHT),
+                    rng.uniform(TheRNG.ENEMY_MIN_SPEED,
+                                TheRNG.ENEMY_MAX_SPEED),
+                    simulation, str(rng.randint(1, 1024)))
+        server.tick(time_passed)
+        if i > 2:  # after everyone has had their full snapshot
+            times.append(server.tick_ns / 1e6)
+            sizes.append(server.tick_bytes)
+        # the bots steer at random now and then
+        for bot, receiver in bots:
+            if rng.random() < 0.05:
+                bot.send_keys(*[rng.randint(0, 1) for k in range(4)])
+        await asyncio.sleep(0)
+
+    # let the bots catch up, then check their copies against the server's
+    deadline = time.perf_counter() + 10
+    while any(bot.tick < server.snapshotter.tick for bot, r in bots) and \
+            time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    actual = dict((enemy.serial, enemy.pos)
+                  for enemy in server.simulation.enemies)
+    error = 0.0
+    for bot, receiver in bots:
+        for serial, enemy, x, y in bot.enemy_positions():
+            ax, ay = actual[serial]
+            error = max(error, abs(ax - x), abs(ay - y))
+        receiver.cancel()
+        bot.close()
+    await server.close()
+
+    times.sort()
+    return {
+        'clients': clients,
+        'enemies': enemies,
+        'p50_ms': percentile(times, 0.5),
+        'p95_ms': percentile(times, 0.95),
+        'delta_bytes': sum(sizes) / len(sizes),
+        'max_error_px': error,
+    }
+
+
+def bench(client_counts, enemy_counts, ticks, tick_rate):
+    print('%7s %7s %8s %8s %10s %11s %9s' % (
+        'clients', 'enemies', 'p50', 'p95', 'max ticks/s', 'bytes/tick',
+        'error px'))
+    for enemies in enemy_counts:
+        for clients in client_counts:
+            result = asyncio.run(
+                bench_one(clients, enemies, ticks, tick_rate))
+            print('%7d %7d %6.2fms %6.2fms %11.0f %11.0f %9.2f' % (
+                clients, enemies, result['p50_ms'], result['p95_ms'],
+                1000 / result['p95_ms'], result['delta_bytes'],
+                result['max_error_px']))
+
+
+def main(argv):
+    if not argv or argv[0] not in ('server', 'client', 'bench'):
+        sys.exit(__doc__)
+    command = argv[0]
+    opts, args = getopt.getopt(argv[1:], '', [
+        'host=', 'port=', 'tick-rate=', 'seed=', 'clients=', 'enemies=',
+        'ticks='])
+    opts = dict(opts)
+    host = opts.get('--host', 'localhost' if command == 'client' else '')
+    port = int(opts.get('--port', DEFAULT_PORT))
+    tick_rate = int(opts.get('--tick-rate', DEFAULT_TICK_RATE))
+
+    if command == 'server':
+        async def serve():
+            seed = opts.get('--seed')
+            server = GameServer(tick_rate,
+                                seed=None if seed is None else int(seed))
+            await server.start(host, port)
+            print('Serving on port %d, %d ticks a second' % (
+                port, tick_rate))
+            await server.ticker
+        asyncio.run(serve())
+    elif command == 'client':
+        asyncio.run(play(host, port))
+    else:
+        clients = [int(n) for n in opts.get('--clients', '1,8,32').split(',')]
+        enemies = [int(n) for n in opts.get('--enemies', '100,500').split(',')]
+        bench(clients, enemies, int(opts.get('--ticks', 300)), tick_rate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""Frame-rate independent physics helpers.
+
+The game simulates in fixed steps of simulation time: however long a frame
+took, the time is handed to a FixedTimestep, which says how many whole steps
+to run. This keeps the cost of a frame bounded after a hitch, and makes a
+game play out the same at 30, 60 or 240 FPS.
+
+As frame times jitter around the step length, some frames run no step and
+the next ones two, so sprites are drawn ahead of the last step by the time
+left over in the accumulator (see FixedTimestep.alpha), or they would stop
+for a frame and then jump.
+"""
+
+
+def friction_decay(velocity, friction, time_passed):
+    """Returns velocity after friction has been applied once per millisecond
+    for time_passed milliseconds, i.e. velocity * (1 - friction) ** t,
+    without looping over the milliseconds. time_passed may be fractional."""
+    return velocity * (1.0 - friction) ** time_passed
+
+
+class FixedTimestep(object):
+
+    """Accumulates frame time and hands it out in fixed-size steps.
+
+    step: length of one simulation step, in milliseconds.
+    max_steps: the most steps a single frame may run. Any more time than
+        that (after a long hitch) is dropped, so the game slows down for a
+        moment instead of spending several frames catching up.
+    """
+
+    def __init__(self, step, max_steps=15):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def advance(self, time_passed):
+        """Adds time_passed milliseconds and returns how many steps should
+        be simulated now."""
+        self.accumulator += time_passed
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator %= self.step
+        else:
+            self.accumulator -= steps * self.step
+        return steps
+
+    def alpha(self):
+        """How far, from 0 to 1, the simulation is into the next step."""
+        return self.accumulator / self.step
@@ -0,0 +1,173 @@
+"""Timing where each frame's time goes.
+
+The game loop calls lap(phase) after each phase of a frame (input,
+collision, spawning, ...); the time since the previous lap is added to that
+phase. A phase may be lapped several times a frame (e.g. once per physics
+step) and its times are summed. The last few seconds of frames are kept for
+the debug overlay and can be written out as CSV.
+
+When profiling is off the game uses NULL_PROFILER, whose methods do
+nothing.
+
+StartupTimer times the steps of starting the game instead, and CpuMeter
+how much CPU time the game uses while it sits in a menu.
+"""
+
+import csv
+import time
+from collections import deque
+
+# upper bounds, in milliseconds, of the frame time histogram's bins; the
+# last bin holds everything slower
+HISTOGRAM_BINS = [4, 8, 12, 17, 20, 25, 33, 50]
+
+
+class NullProfiler(object):
+
+    """A profiler that does nothing, for when profiling is off."""
+
+    enabled = False
+
+    def begin_frame(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class PhaseProfiler(object):
+
+    """Times the phases of each frame with time.perf_counter_ns.
+
+    phases: names of the phases, in the order they should be reported.
+        Laps of other phases are counted under 'other'.
+    history: number of frames to keep.
+    """
+
+    enabled = True
+
+    def __init__(self, phases, history=600):
+        self.phases = list(phases) + ['other']
+        self.index = dict((phase, i) for i, phase in enumerate(self.phases))
+        self.history = history
+        # one row per frame: [frame number, total, phase times...] in ns
+        self.frames = deque(maxlen=history)
+        self.frame_number = 0
+        self.current = [0] * len(self.phases)
+        self.last = self.start = time.perf_counter_ns()
+
+    def begin_frame(self):
+        self.current = [0] * len(self.phases)
+        self.last = self.start = time.perf_counter_ns()
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        i = self.index.get(phase, -1)
+        self.current[i] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        now = time.perf_counter_ns()
+        self.current[-1] += now - self.last
+        self.frames.append([self.frame_number, now - self.start]
+                           + self.current)
+        self.frame_number += 1
+
+    def averages(self, frames=60):
+        """Returns (phase, mean milliseconds) for each phase over the last
+        frames frames."""
+        recent = list(self.frames)[-frames:]
+        if not recent:
+            return [(phase, 0.0) for phase in self.phases]
+        return [(phase, sum(row[i + 2] for row in recent) / len(recent) / 1e6)
+                for i, phase in enumerate(self.phases)]
+
+    def histogram(self):
+        """Returns the number of kept frames whose total time falls in each
+        of HISTOGRAM_BINS, plus one more bin for slower frames."""
+        counts = [0] * (len(HISTOGRAM_BINS) + 1)
+        for row in self.frames:
+            ms = row[1] / 1e6
+            for i, bound in enumerate(HISTOGRAM_BINS):
+                if ms < bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def write_csv(self, path):
+        """Writes the kept frames to path, one row per frame, in ms."""
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame', 'total_ms'] +
+                            [phase + '_ms' for phase in self.phases])
+            for row in self.frames:
+                writer.writerow([row[0]] +
+                                ['%.4f' % (ns / 1e6) for ns in row[1:]])
+
+
+class StartupTimer(object):
+
+    """Times the steps of starting the game, e.g. import -> window -> first
+    menu frame, for tracking cold-start time.
+
+    start: time.perf_counter_ns() when starting began; defaults to now.
+    """
+
+    def __init__(self, start=None):
+        if start is None:
+            start = time.perf_counter_ns()
+        self.start = start
+        self.marks = []
+        self.done = False
+
+    def mark(self, step):
+        """Records that step has just finished."""
+        if not self.done:
+            self.marks.append((step, time.perf_counter_ns()))
+
+    def finish(self, step):
+        """Records the last step; later marks are ignored."""
+        self.mark(step)
+        self.done = True
+
+    def report(self):
+        """Returns the time each step took and the total, as text."""
+        lines = []
+        last = self.start
+        for step, ns in self.marks:
+            lines.append('%-20s %8.1fms %8.1fms' % (
+                step, (ns - last) / 1e6, (ns - self.start) / 1e6))
+            last = ns
+        return '\n'.join(['%-20s %10s %10s' % ('startup', 'step', 'total')]
+                         + lines)
+
+
+class CpuMeter(object):
+
+    """Measures the CPU time the process uses per second of wall time, e.g.
+    while a menu waits for input."""
+
+    def __init__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def cpu_per_second(self):
+        """Seconds of CPU time used per second since the meter started."""
+        wall = time.perf_counter() - self.wall_start
+        if wall <= 0:
+            return 0.0
+        return (time.process_time() - self.cpu_start) / wall
+
+    def report(self, what):
+        """Returns the CPU time used while doing what, as text."""
+        return '%s: %.1fs, %.1fms CPU per second (%.1f%% of a core)' % (
+            what, time.perf_counter() - self.wall_start,
+            1000 * self.cpu_per_second(), 100 * self.cpu_per_second())
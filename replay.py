@@ -0,0 +1,110 @@
+"""Recording games to a file and playing them back.
+
+A game is fully determined by its random seed, the time each frame took
+and the keys pressed and released each frame, so that is all a replay
+holds. Replays are JSON, one line per frame:
+
+    {"version": 1, "seed": ..., "controls": [...], "numpy_enemies": ...}
+    [time_since_last_frame, [[event_type, key], ...]]
+    ...
+    {"end": true, "frames": ..., "digest": ...}
+
+The digest at the end is a hash of the final game state, so playing a
+replay back can check that it reproduced the session exactly.
+"""
+
+import hashlib
+import json
+
+# 2: collisions test pixels, so games play out differently than in 1
+# 3: digests hash every number as a float, and the player's hitbox is back
+# to 2x2
+REPLAY_VERSION = 3
+
+
+def digest(simulation):
+    """Returns a hash of the state of simulation: level, score, timers and
+    the exact positions and velocities of every player and enemy.
+
+    Every number is hashed as a float, so a 0 and a 0.0 (say, in a
+    restored game's velocities) hash the same."""
+    state = [simulation.frames, simulation.level, simulation.score,
+             simulation.spawntime, simulation.time_until_new_level]
+    for player in simulation.players:
+        state.extend(player.pos)
+        state.extend(player.movepos)
+    for enemy in simulation.enemies:
+        state.extend(enemy.pos)
+        state.extend(enemy.movepos)
+    return hashlib.sha1(
+        repr([float(value) for value in state]).encode()).hexdigest()
+
+
+class ReplayRecorder(object):
+
+    """Writes a replay of a game to path, frame by frame."""
+
+    def __init__(self, path, seed, controls, numpy_enemies):
+        self.file = open(path, 'w')
+        self.frames = 0
+        self._write({'version': REPLAY_VERSION, 'seed': seed,
+                     'controls': list(controls),
+                     'numpy_enemies': numpy_enemies})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def record_frame(self, time_passed, key_events):
+        """key_events is a list of (event type, key) pairs."""
+        self._write([time_passed, [list(e) for e in key_events]])
+        self.frames += 1
+
+    def close(self, final_digest=None):
+        self._write({'end': True, 'frames': self.frames,
+                     'digest': final_digest})
+        self.file.close()
+
+
+class ReplayPlayer(object):
+
+    """Reads a replay from path and hands it out a frame at a time."""
+
+    def __init__(self, path):
+        with open(path) as file:
+            lines = file.read().splitlines()
+        header = json.loads(lines[0])
+        if header.get('version') != REPLAY_VERSION:
+            raise ValueError('unsupported replay version: %r'
+                             % header.get('version'))
+        self.seed = header['seed']
+        self.controls = header['controls']
+        self.numpy_enemies = header['numpy_enemies']
+        self.frames = []
+        self.end = None
+        for line in lines[1:]:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                self.end = record
+                break
+            time_passed, key_events = record
+            self.frames.append(
+                (time_passed, [tuple(e) for e in key_events]))
+        self.position = 0
+
+    @property
+    def finished(self):
+        return self.position >= len(self.frames)
+
+    def next_frame(self):
+        """Returns (time_passed, key_events) for the next frame, or None
+        once every frame has been played."""
+        if self.finished:
+            return None
+        frame = self.frames[self.position]
+        self.position += 1
+        return frame
+
+    def matches(self, final_digest):
+        """True if final_digest is the one recorded at the end of the
+        replay (False if the recording never ended cleanly)."""
+        return bool(self.end) and self.end['digest'] == final_digest
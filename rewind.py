@@ -0,0 +1,100 @@
+"""The last few seconds of a game, a snapshot per frame, for rewinding.
+
+RewindBuffer keeps the snapshots (see snapshot.py) of the most recent
+frames in one bytearray allocated up front, written round and round: each
+new snapshot goes after the previous one, wrapping to the start when it
+doesn't fit before the end, and overwrites the oldest ones in its way. So
+memory never grows, however long the game runs, and the number of frames
+kept shrinks as snapshots grow with the number of enemies on screen.
+"""
+
+from array import array
+
+DEFAULT_FRAMES = 300  # 5 seconds at 60 FPS
+DEFAULT_BYTES = 8 * 1024 * 1024
+
+
+class RewindBuffer(object):
+
+    """Snapshots of up to frames recent frames, in max_bytes of memory.
+
+    Frames are counted back from the newest: get(0) is the newest snapshot,
+    get(1) the one before it, and so on.
+    """
+
+    def __init__(self, frames=DEFAULT_FRAMES, max_bytes=DEFAULT_BYTES):
+        self.buffer = bytearray(max_bytes)
+        self.view = memoryview(self.buffer)
+        # where each slot's snapshot starts in buffer, and its length; slots
+        # are used round and round too
+        self.offsets = array('L', [0] * frames)
+        self.lengths = array('L', [0] * frames)
+        self.frames = frames
+        self.clear()
+
+    def clear(self):
+        self.oldest = 0  # slot of the oldest snapshot
+        self.count = 0
+        self.end = 0  # where in buffer the next snapshot goes
+        self.bytes_used = 0
+        # snapshots too big to fit in the buffer at all
+        self.dropped = 0
+
+    def _drop_oldest(self):
+        self.bytes_used -= self.lengths[self.oldest]
+        self.oldest = (self.oldest + 1) % self.frames
+        self.count -= 1
+
+    def record(self, data):
+        """Adds data, the newest frame's snapshot, dropping the oldest
+        frames as needed to make room."""
+        n = len(data)
+        if n > len(self.buffer):
+            self.dropped += 1
+            return
+        start = self.end
+        if start + n > len(self.buffer):
+            # wrap to the start; everything from here to the end of the
+            # buffer is older than what is at the start, so goes first
+            while self.count and self.offsets[self.oldest] >= start:
+                self._drop_oldest()
+            start = 0
+        # then whatever the new snapshot would overwrite
+        while self.count and (
+                self.offsets[self.oldest] < start + n and
+                start < self.offsets[self.oldest] +
+                self.lengths[self.oldest]):
+            self._drop_oldest()
+        if self.count == self.frames:
+            self._drop_oldest()
+
+        slot = (self.oldest + self.count) % self.frames
+        self.view[start:start + n] = data
+        self.offsets[slot] = start
+        self.lengths[slot] = n
+        self.count += 1
+        self.bytes_used += n
+        self.end = start + n
+
+    def get(self, back):
+        """Returns the snapshot of back frames before the newest."""
+        if not 0 <= back < self.count:
+            raise IndexError('only %d frames kept' % self.count)
+        slot = (self.oldest + self.count - 1 - back) % self.frames
+        start = self.offsets[slot]
+        return bytes(self.view[start:start + self.lengths[slot]])
+
+    def discard(self, newest):
+        """Drops the newest frames, e.g. to carry on playing from an
+        earlier one."""
+        for i in range(min(newest, self.count)):
+            slot = (self.oldest + self.count - 1) % self.frames
+            self.bytes_used -= self.lengths[slot]
+            self.count -= 1
+            self.end = self.offsets[slot]
+
+    def capacity_bytes(self):
+        return len(self.buffer)
+
+    def __len__(self):
+        return self.count
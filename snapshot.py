@@ -0,0 +1,238 @@
+"""A compact binary snapshot of a Simulation's state.
+
+write() packs everything the game needs to carry on exactly where it was
+into bytes: the counters, level, score and timers, the state of the random
+number generators, the players' positions, velocities and keys, and every
+enemy's position, velocity, speed, flags, text, scale and rotation. No
+Surfaces are saved; glyphs are rebuilt from the text when the snapshot is
+restored (see Simulation.restore in TheRNG.py).
+
+The layout, all little-endian:
+
+    header                  HEADER, then the Mersenne Twister's state as
+                            unsigned 32-bit ints
+    NumPy generator state   PCG64_STATE, only if the NUMPY_RNG flag is set
+    players                 PLAYER and the controls string, for each
+    deaths                  DEATH and the controls and kind strings, for each
+    enemies                 one array per field rather than one record per
+                            enemy: x and y, velocity x and y (doubles),
+                            speed (doubles), serial (unsigned 32-bit),
+                            flags, scale, angle / 90 and text length (bytes),
+                            then all the texts run together
+
+Strings are a byte of length followed by UTF-8. An enemy with a scale of 0
+is a level banner rather than a number.
+
+Enemies are written a field at a time so that a few hundred of them pack in
+well under a millisecond.
+"""
+
+import struct
+import sys
+from array import array
+from itertools import accumulate
+
+MAGIC = b'RNGS'
+SNAPSHOT_VERSION = 1
+
+# magic, version, flags, frames, steps, time, level, score, spawntime,
+# time until new level, physics accumulator, gauss_next, number of players,
+# deaths and enemies, and length of the random state
+HEADER = struct.Struct('<4sHHIIdIIddddHHIH')
+# the PCG64 state and increment, has_uint32, uinteger
+PCG64_STATE = struct.Struct('<16s16sBI')
+# pos x, y, movepos x, y, and the move keys as bits
+PLAYER = struct.Struct('<ddddB')
+# time, level
+DEATH = struct.Struct('<dI')
+
+# bits in the header's flags
+GAME_OVER = 1
+GAUSS_NEXT = 2
+NUMPY_RNG = 4
+
+# bits in an enemy's flags; the same as enemystore's
+ERRATIC = 1
+AIMED = 2
+ROTATED = 4
+
+# bits in a player's keys
+MOVE_KEYS = ('moveleft', 'moveright', 'moveup', 'movedown')
+
+
+def little_endian(values):
+    # arrays are written in the machine's byte order
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def read_array(typecode, data, offset, count):
+    # returns (array of count items read at offset, offset after them)
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end
+
+
+def pack_string(text):
+    data = text.encode('utf-8')
+    return bytes((len(data),)) + data
+
+
+def unpack_string(data, offset):
+    # returns (string, offset after it)
+    end = offset + 1 + data[offset]
+    return data[offset + 1:end].decode('utf-8'), end
+
+
+def write(simulation):
+    """Returns the state of simulation as bytes."""
+    version, mt_state, gauss_next = simulation.random.getstate()
+    players = simulation.players
+    deaths = simulation.deaths
+    # read from the container, as an EnemyStore's Enemy objects may be
+    # behind its arrays
+    enemies, positions, velocities = simulation.enemies.motion()
+    rng = getattr(simulation.enemies, 'rng', None)
+
+    flags = 0
+    if simulation.game_over:
+        flags |= GAME_OVER
+    if gauss_next is not None:
+        flags |= GAUSS_NEXT
+    if rng is not None:
+        flags |= NUMPY_RNG
+    parts = [HEADER.pack(
+        MAGIC, SNAPSHOT_VERSION, flags, simulation.frames, simulation.steps,
+        simulation.time, simulation.level, simulation.score,
+        simulation.spawntime, simulation.time_until_new_level,
+        simulation.physics.accumulator, gauss_next or 0.0, len(players),
+        len(deaths), len(enemies), len(mt_state)),
+        little_endian(array('I', mt_state))]
+    if rng is not None:
+        state = rng.bit_generator.state
+        if state['bit_generator'] != 'PCG64':
+            raise ValueError('can only save PCG64 generators, not %s'
+                             % state['bit_generator'])
+        parts.append(PCG64_STATE.pack(
+            state['state']['state'].to_bytes(16, 'little'),
+            state['state']['inc'].to_bytes(16, 'little'),
+            state['has_uint32'], state['uinteger']))
+
+    for player in players:
+        keys = 0
+        for bit, name in enumerate(MOVE_KEYS):
+            if getattr(player, name):
+                keys |= 1 << bit
+        parts.append(PLAYER.pack(player.pos[0], player.pos[1],
+                                 player.movepos[0], player.movepos[1], keys))
+        parts.append(pack_string(player.controls))
+    for time, level, controls, kind in deaths:
+        parts.append(DEATH.pack(time, level))
+        parts.append(pack_string(controls))
+        parts.append(pack_string(kind))
+
+    positions = array('d', positions)
+    velocities = array('d', velocities)
+    speeds = array('d', [enemy.speed for enemy in enemies])
+    serials = array('I', [enemy.serial for enemy in enemies])
+    # the flags are bools, so can be shifted into place
+    enemy_flags = bytes([enemy.erratic | enemy.aimed << 1 |
+                         enemy.rotated << 2 for enemy in enemies])
+    scales = bytes([enemy.scale for enemy in enemies])
+    angles = bytes([enemy.angle // 90 for enemy in enemies])
+    texts = [enemy.text.encode('utf-8') for enemy in enemies]
+    parts += [little_endian(positions), little_endian(velocities),
+              little_endian(speeds), little_endian(serials), enemy_flags,
+              scales, angles, bytes([len(text) for text in texts])]
+    parts += texts
+    return b''.join(parts)
+
+
+class Snapshot(object):
+
+    """A snapshot read back from bytes.
+
+    Has the header's fields as attributes, random_state (for
+    random.setstate), numpy_state (for a NumPy generator's
+    bit_generator.state, or None), players as a list of (controls, pos,
+    movepos, keys) with keys a dict of move flags, deaths as the list
+    Simulation.deaths had, and the enemies as one list per field (see
+    enemies()).
+    """
+
+    def __init__(self, data):
+        (magic, version, flags, self.frames, self.steps, self.time,
+         self.level, self.score, self.spawntime, self.time_until_new_level,
+         self.accumulator, gauss_next, player_count, death_count,
+         enemy_count, mt_length) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('not a game snapshot')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError('unsupported snapshot version: %r' % version)
+        self.game_over = bool(flags & GAME_OVER)
+        offset = HEADER.size
+        mt_state, offset = read_array('I', data, offset, mt_length)
+        self.random_state = (3, tuple(mt_state), gauss_next
+                             if flags & GAUSS_NEXT else None)
+
+        self.numpy_state = None
+        if flags & NUMPY_RNG:
+            state, inc, has_uint32, uinteger = PCG64_STATE.unpack_from(
+                data, offset)
+            offset += PCG64_STATE.size
+            self.numpy_state = {
+                'bit_generator': 'PCG64',
+                'state': {'state': int.from_bytes(state, 'little'),
+                          'inc': int.from_bytes(inc, 'little')},
+                'has_uint32': has_uint32, 'uinteger': uinteger}
+
+        self.players = []
+        for i in range(player_count):
+            x, y, vx, vy, bits = PLAYER.unpack_from(data, offset)
+            controls, offset = unpack_string(data, offset + PLAYER.size)
+            keys = dict((name, int(bool(bits & (1 << bit))))
+                        for bit, name in enumerate(MOVE_KEYS))
+            self.players.append((controls, (x, y), [vx, vy], keys))
+        self.deaths = []
+        for i in range(death_count):
+            time, level = DEATH.unpack_from(data, offset)
+            controls, offset = unpack_string(data, offset + DEATH.size)
+            kind, offset = unpack_string(data, offset)
+            self.deaths.append((time, level, controls, kind))
+
+        n = enemy_count
+        self.positions, offset = read_array('d', data, offset, 2 * n)
+        self.velocities, offset = read_array('d', data, offset, 2 * n)
+        self.speeds, offset = read_array('d', data, offset, n)
+        self.serials, offset = read_array('I', data, offset, n)
+        self.flags = data[offset:offset + n]
+        self.scales = data[offset + n:offset + 2 * n]
+        self.angles = [a * 90 for a in data[offset + 2 * n:offset + 3 * n]]
+        lengths = data[offset + 3 * n:offset + 4 * n]
+        offset += 4 * n
+        ends = list(accumulate(lengths, initial=offset))
+        self.texts = [data[ends[i]:ends[i + 1]].decode('utf-8')
+                      for i in range(n)]
+
+    def enemies(self):
+        """Yields (text, scale, pos, movepos, speed, erratic, aimed, rotated,
+        angle, serial) for each enemy, in the order they were in."""
+        positions = self.positions
+        velocities = self.velocities
+        for i, flags in enumerate(self.flags):
+            yield (self.texts[i], self.scales[i],
+                   (positions[2 * i], positions[2 * i + 1]),
+                   [velocities[2 * i], velocities[2 * i + 1]],
+                   self.speeds[i], bool(flags & ERRATIC),
+                   bool(flags & AIMED), bool(flags & ROTATED),
+                   self.angles[i], self.serials[i])
+
+
+def read(data):
+    """Returns the Snapshot in data, which write() made."""
+    return Snapshot(data)
@@ -0,0 +1,103 @@
+"""A uniform grid over the play field for finding enemies near a rect.
+
+Enemies are binned into fixed-size cells, and a query only looks at the
+enemies in the cells its rect overlaps. Binning every enemy is a Python
+loop, which costs far more than testing a few rects against every enemy in
+C (see Simulation.step), so the grid is only worth building for many or
+wide queries, and only when something asks: the avoid bot looking for
+enemies near it, say.
+"""
+
+import time
+
+
+class SpatialHash(object):
+
+    """Uniform grid (spatial hash) of items with a .rect attribute.
+
+    Items partly or wholly outside the field are kept in the nearest edge
+    cells, so nothing is ever missed, only tested more often.
+
+    Counters, kept until reset_counters() is called:
+    queries: number of query() calls
+    candidates: number of items those queries looked at
+    brute_force: number of items a linear scan would have looked at
+    rebuilds: number of rebuild() calls
+    rebuild_ns: nanoseconds those took
+    """
+
+    def __init__(self, width, height, cell_size=64):
+        self.cell_size = cell_size
+        self.cols = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        self.cells = [[] for i in range(self.cols * self.rows)]
+        self.size = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.queries = 0
+        self.candidates = 0
+        self.brute_force = 0
+        self.rebuilds = 0
+        self.rebuild_ns = 0
+
+    def pruning_ratio(self):
+        """Fraction of the linear scan's items that were looked at."""
+        if not self.brute_force:
+            return 0.0
+        return self.candidates / self.brute_force
+
+    def rebuild_time(self):
+        """Mean microseconds per rebuild, which queries have to make up
+        for."""
+        if not self.rebuilds:
+            return 0.0
+        return self.rebuild_ns / self.rebuilds / 1000
+
+    def _span(self, rect):
+        # range of cells covered by rect, clamped to the grid
+        cs = self.cell_size
+        x0 = min(max(rect.left // cs, 0), self.cols - 1)
+        x1 = min(max((rect.right - 1) // cs, 0), self.cols - 1)
+        y0 = min(max(rect.top // cs, 0), self.rows - 1)
+        y1 = min(max((rect.bottom - 1) // cs, 0), self.rows - 1)
+        return x0, y0, x1, y1
+
+    def clear(self):
+        for cell in self.cells:
+            cell.clear()
+        self.size = 0
+
+    def insert(self, item):
+        x0, y0, x1, y1 = self._span(item.rect)
+        cells = self.cells
+        for y in range(y0, y1 + 1):
+            row = y * self.cols
+            for x in range(x0, x1 + 1):
+                cells[row + x].append(item)
+        self.size += 1
+
+    def rebuild(self, items):
+        """Empties the grid and bins every item in items."""
+        start = time.perf_counter_ns()
+        self.clear()
+        for item in items:
+            self.insert(item)
+        self.rebuild_ns += time.perf_counter_ns() - start
+        self.rebuilds += 1
+
+    def query(self, rect):
+        """Returns the items in the cells rect overlaps, without
+        duplicates. They do not necessarily collide with rect."""
+        self.queries += 1
+        self.brute_force += self.size
+        x0, y0, x1, y1 = self._span(rect)
+        found = {}
+        for y in range(y0, y1 + 1):
+            row = y * self.cols
+            for x in range(x0, x1 + 1):
+                cell = self.cells[row + x]
+                self.candidates += len(cell)
+                for item in cell:
+                    found[id(item)] = item
+        return list(found.values())
@@ -0,0 +1,8 @@
+"""Summary statistics shared by the benchmarks and reports."""
+
+
+def percentile(sorted_values, fraction):
+    """Returns the nearest-rank percentile (fraction from 0 to 1) of an
+    already sorted, non-empty list."""
+    i = max(0, int(round(fraction * len(sorted_values))) - 1)
+    return sorted_values[i]
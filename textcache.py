@@ -0,0 +1,82 @@
+"""Shared fonts and a cache of rendered text.
+
+Creating a pygame Font reads and parses the font file, and rendering text
+allocates a new Surface, so doing either every frame for text that hardly
+ever changes is wasted work. FontRegistry makes one Font per (file, size)
+and TextCache keeps the Surfaces it has rendered, so text is only rendered
+again when the string (or its color) actually changes.
+"""
+
+import time
+from collections import OrderedDict
+
+import pygame
+
+
+class FontRegistry(object):
+
+    """One pygame Font per (file, size), created on first use.
+    file is a path to a font file, or None for pygame's default font."""
+
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, name, size):
+        font = self.fonts.get((name, size))
+        if font is None:
+            if not pygame.font.get_init():
+                # headless games never call pygame.init()
+                pygame.font.init()
+            font = pygame.font.Font(name, size)
+            self.fonts[(name, size)] = font
+        return font
+
+
+class TextCache(object):
+
+    """Least-recently-used cache of rendered text Surfaces.
+
+    Surfaces are keyed on (font, text, color, antialias). Fonts come from a
+    FontRegistry, so a font stands for its file and size. The Surfaces are
+    shared, so never draw on them.
+
+    It also measures what rendering costs on a miss, to estimate how much
+    time the hits saved; call begin_frame() once per frame to get
+    saved_last_frame (in nanoseconds).
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.render_ns = 0
+        self.frame_hits = 0
+        self.saved_last_frame = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = font, text, tuple(color), antialias
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.frame_hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        start = time.perf_counter_ns()
+        surface = font.render(text, antialias, color)
+        self.render_ns += time.perf_counter_ns() - start
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def average_render_ns(self):
+        return self.render_ns / self.misses if self.misses else 0
+
+    def begin_frame(self):
+        self.saved_last_frame = self.frame_hits * self.average_render_ns()
+        self.frame_hits = 0
+
+    def clear(self):
+        self.surfaces.clear()